@@ -0,0 +1,142 @@
+from dataclasses import dataclass, field
+import heapq
+import math
+
+from shortest_path import BudgetExceeded, SearchResult, single_source
+
+@dataclass  # The routes of k_shortest_paths as one SearchResult (for the batch API): the shortest, with the rest after it
+class AlternativeRoutes(SearchResult):
+    alternatives: list = field(default_factory=list)  # the 2nd to kth shortest routes, as SearchResults
+
+# Yen's k shortest loopless paths from start to goal, as a list of SearchResults from shortest to longest.
+# Every next route leaves one of the routes already found at some spur node, after following it exactly from the
+# start (the root), and then takes the shortest way to the goal that doesn't reuse the root or an edge out of the spur
+# that an earlier route with the same root took.
+# One Dijkstra tree grown from the goal is shared by every spur search:
+#   - to_goal[node] is the exact road km from node to the goal with nothing banned. Banning roads only makes routes
+#     longer, so it is a consistent A* heuristic for the spur searches (and never below the haversine distance).
+#   - a spur search stops at the first node whose tree path to the goal avoids everything banned (usually within a
+#     few steps of the spur), instead of searching all the way to the goal.
+#   - root km + to_goal[spur] is a lower bound on every route through that spur, so spurs that can't beat the
+#     candidates already waiting are skipped.
+# If a SearchBudget is given and runs out (the goal tree counts against it too), the result is a BudgetExceeded instead
+# of the list: its path is the shortest route, or just the start if the budget ran out before that was known.
+# If a SearchStats is given it is filled in.
+def k_shortest_paths(graph, start, goal, k, budget=None, stats=None):
+    if budget is not None:
+        budget.start()
+    tree = single_source(graph, goal, budget=budget)
+    if tree is None:
+        return BudgetExceeded([start], 0.0, budget.expansions, budget.reason)
+    to_goal, toward_goal = tree  # toward_goal[node] is the next node on its shortest way to the goal
+    if k <= 0 or to_goal[start] == math.inf:
+        return []
+
+    found = [SearchResult(tree_path(toward_goal, start), to_goal[start], 0)]
+    candidates = []  # heap of (km, path) waiting to be picked
+    seen = {tuple(found[0].path)}
+    banned = bytearray(len(graph))
+
+    while len(found) < k:
+        last = found[-1].path
+        root_cost = 0.0
+        for i, spur in enumerate(last[:-1]):
+            if i > 0:
+                root_cost += graph.weights[graph.find_edge(last[i - 1], spur)]
+            still_needed = k - len(found)
+            if len(candidates) >= still_needed and root_cost + to_goal[spur] >= heapq.nsmallest(still_needed, candidates)[-1][0]:
+                continue  # no route through this spur can make the cut
+
+            root = last[:i + 1]
+            used = {route.path[i + 1] for route in found if route.path[:i + 1] == root}  # edges out of the spur already taken
+            for node in root[:-1]:
+                banned[node] = 1
+            spur_path, spur_cost = spur_search(graph, spur, goal, to_goal, toward_goal, banned, used, budget, stats)
+            for node in root[:-1]:
+                banned[node] = 0
+            if spur_path == "budget":
+                return BudgetExceeded(found[0].path, found[0].distance, budget.expansions, budget.reason)
+
+            if spur_path is not None:
+                path = root[:-1] + spur_path
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    heapq.heappush(candidates, (root_cost + spur_cost, path))
+
+        if not candidates:  # every loopless route has been found
+            break
+        cost, path = heapq.heappop(candidates)
+        found.append(SearchResult(path, cost, 0))
+
+    return found
+
+# Follows the goal tree from node to the goal
+def tree_path(toward_goal, node):
+    path = [node]
+    while toward_goal[node] != -1:
+        node = toward_goal[node]
+        path.append(node)
+    return path
+
+# Shortest spur -> goal path that avoids the banned nodes and doesn't leave the spur to a node in used.
+# Returns (path, km), (None, inf) if there is none, or ("budget", inf) if the budget ran out.
+# With to_goal as the heuristic, the first node popped whose goal tree path is still allowed (and doesn't loop back
+# into the path to it) finishes the search: its priority is exactly the length of going there and then down the tree,
+# and nothing left in the frontier can beat it.
+def spur_search(graph, spur, goal, to_goal, toward_goal, banned, used, budget=None, stats=None):
+    if to_goal[spur] == math.inf:
+        return None, math.inf
+    allowed = {-1: True}  # node -> whether its goal tree path avoids every banned node
+
+    def tree_allowed(node):
+        chain = []
+        while node not in allowed:
+            chain.append(node)
+            node = toward_goal[node]
+        ok = allowed[node]
+        for node in reversed(chain):
+            ok = ok and not banned[node]
+            allowed[node] = ok
+        return ok
+
+    parent = {spur: -1}
+    dist = {spur: 0.0}
+    closed = set()
+    frontier = [(to_goal[spur], 0.0, spur)]
+    if stats is not None:
+        stats.heap_pushes += 1
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    while frontier:
+        _, cost, current = heapq.heappop(frontier)
+        if stats is not None:
+            stats.heap_pops += 1
+        if current in closed:
+            continue
+        if budget is not None and budget.spent(len(frontier)):
+            return "budget", math.inf
+        closed.add(current)
+        if stats is not None:
+            stats.expand(len(frontier), len(closed), offsets[current + 1] - offsets[current])
+
+        if (current != spur or toward_goal[spur] not in used) and tree_allowed(current):
+            path = []
+            node = current
+            while node != -1:
+                path.append(node)
+                node = parent[node]
+            rest = tree_path(toward_goal, current)[1:]
+            if not set(path).intersection(rest):  # going down the tree must not loop back into the spur path
+                return path[::-1] + rest, cost + to_goal[current]
+
+        for i in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[i]
+            if banned[neighbor] or neighbor in closed or (current == spur and neighbor in used):
+                continue
+            new_cost = cost + weights[i]
+            if new_cost < dist.get(neighbor, math.inf):
+                dist[neighbor] = new_cost
+                parent[neighbor] = current
+                heapq.heappush(frontier, (new_cost + to_goal[neighbor], new_cost, neighbor))
+                if stats is not None:
+                    stats.heap_pushes += 1
+    return None, math.inf
@@ -0,0 +1,274 @@
+from collections import OrderedDict, deque
+import math
+import multiprocessing
+import os
+
+from alternatives import AlternativeRoutes
+import main
+from shortest_path import BudgetExceeded, SearchResult, path_length, path_to, single_source
+from spatial import snap_to_city
+
+# Algorithms that always return a shortest path by road length, so one Dijkstra tree per origin answers all of them
+SHORTEST_PATH_ALGORITHMS = {"a*", "dijkstra", "bidirectional a*", "ch", "lpa*"}
+# Algorithms that return a path with the fewest hops, so one BFS tree per origin answers all of them
+FEWEST_HOPS_ALGORITHMS = {"bfs", "bidirectional bfs"}
+# Algorithms whose route depends on the road lengths without always being the shortest (IDA* grows its threshold by
+# ida_star_growth), so any change to any road's length can change their answer
+WEIGHT_AWARE_ALGORITHMS = {"ida*"}
+# Algorithms whose answer also depends on max_depth (the iddfs depth limit and the IDA* memory ceiling)
+DEPTH_LIMITED_ALGORITHMS = {"iddfs", "ida*"}
+
+# Algorithms whose answer is more than a RouteCache entry keeps (k shortest has its alternatives), so they aren't cached
+UNCACHED_ALGORITHMS = {"k shortest"}
+
+# RouteCache key of a query, max_depth is part of it only for the algorithms it changes
+def route_key(algorithm, start, goal, max_depth=None):
+    return (algorithm, start, goal, max_depth if algorithm in DEPTH_LIMITED_ALGORITHMS else None)
+
+# LRU cache of recent route_key(algorithm, start, goal, max_depth) -> (path, distance) answers.
+# Memory is bounded by both the number of entries and the total number of cities stored across all the cached paths.
+class RouteCache:
+    def __init__(self, max_entries=10_000, max_path_nodes=1_000_000):
+        self.max_entries = max_entries
+        self.max_path_nodes = max_path_nodes
+        self.entries = OrderedDict()
+        self.path_nodes = 0
+        self.hits = 0
+        self.misses = 0
+        self.version = 0  # how many of the graph's road edits the entries have been checked against
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):  # returns a fresh SearchResult, or None on a miss
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        path, distance = entry
+        return SearchResult(list(path) if path is not None else None, distance, 0)
+
+    def put(self, key, result):
+        if key in self.entries:
+            self.discard(key)
+        path = tuple(result.path) if result.path is not None else None
+        self.entries[key] = (path, result.distance)
+        self.path_nodes += len(path) if path else 0
+        while len(self.entries) > self.max_entries or self.path_nodes > self.max_path_nodes:
+            self.discard(next(iter(self.entries)))  # evict the least recently used
+
+    def discard(self, key):
+        path, _ = self.entries.pop(key)
+        self.path_nodes -= len(path) if path else 0
+
+    def clear(self):
+        self.entries.clear()
+        self.path_nodes = 0
+
+    # Drops only the entries that the road edits made since the last refresh could have made wrong.
+    # An entry whose path uses the edited road is always dropped. Otherwise a road that got longer or closed can't
+    # help any other route, so shortest and fewest hop answers stand. A road that got shorter or opened only matters
+    # to a shortest path if even the straight line km start -> road -> goal beats it, and to a fewest hop path if it
+    # opened. IDA* answers are dropped on any road edit. The other searches follow the neighbor lists in order and
+    # ignore the lengths, so any opened or closed road can change them.
+    def refresh(self, graph):
+        for a, b, old, new in graph.changes[self.version:]:
+            road = {(graph.names[a], graph.names[b]), (graph.names[b], graph.names[a])}
+            for key in list(self.entries):
+                algorithm, start, goal, _ = key
+                path, distance = self.entries[key]
+                if path is not None and any(step in road for step in zip(path, path[1:])):
+                    self.discard(key)
+                elif algorithm in SHORTEST_PATH_ALGORITHMS:
+                    if new < old:
+                        start, goal = graph.ids[start], graph.ids[goal]
+                        bound = new + min(graph.distance(start, a) + graph.distance(b, goal), graph.distance(start, b) + graph.distance(a, goal))
+                        if bound < distance:
+                            self.discard(key)
+                elif algorithm in FEWEST_HOPS_ALGORITHMS:
+                    if old == math.inf:
+                        self.discard(key)
+                elif algorithm in WEIGHT_AWARE_ALGORITHMS:
+                    self.discard(key)
+                elif old == math.inf or new == math.inf:
+                    self.discard(key)
+        self.version = len(graph.changes)
+
+# Runs one query with any of the menu's algorithms and returns a SearchResult with city names and the road length in km.
+# max_depth is the iddfs depth limit and the IDA* memory ceiling (most nodes on its stack). k is how many routes
+# k shortest looks for: its result is an AlternativeRoutes with the shortest route and the others in alternatives.
+# If a SearchStats is given the search fills it in.
+def run_query(graph, algorithm, start, goal, landmarks=None, hierarchy=None, max_depth=None, stats=None, k=3):
+    match algorithm:
+        case "bfs":
+            return main.bfs(graph, start, goal, stats=stats)
+        case "dfs":
+            return main.dfs(graph, start, goal, stats=stats)
+        case "iddfs":
+            return main.iddfs(graph, start, goal, max_depth or len(graph), stats=stats)
+        case "best first search":
+            return main.best_first_search(graph, start, goal, stats=stats)
+        case "a*":
+            return main.a_star_search(graph, start, goal, landmarks, stats=stats)
+        case "dijkstra":
+            return main.dijkstra_search(graph, start, goal, stats=stats)
+        case "bidirectional bfs":
+            return main.bidirectional_bfs_search(graph, start, goal, stats=stats)
+        case "bidirectional a*":
+            return main.bidirectional_a_star_search(graph, start, goal, landmarks, stats=stats)
+        case "ida*":
+            return main.ida_star_search(graph, start, goal, max_depth, stats=stats)
+        case "ch":
+            return main.contraction_hierarchy_search(graph, start, goal, hierarchy, stats=stats)
+        case "lpa*":
+            return main.lpa_star_search(graph, start, goal, stats=stats)
+        case "k shortest":
+            routes = main.k_shortest_search(graph, start, goal, k, stats=stats)
+            if isinstance(routes, BudgetExceeded):
+                return routes
+            if not routes:
+                return SearchResult(None, math.inf, 0)
+            return AlternativeRoutes(routes[0].path, routes[0].distance, routes[0].nodes_expanded, routes[1:])
+        case _:
+            raise ValueError(f"Unknown search algorithm '{algorithm}'")
+
+# Breadth first tree from source, returns the parent list (-1 for the source and for unreachable nodes).
+# With targets it stops as soon as all of them have been reached.
+def bfs_tree(graph, source, targets=None):
+    parent = [-1] * len(graph)
+    seen = bytearray(len(graph))
+    seen[source] = 1
+    remaining = set(targets) - {source} if targets is not None else None
+    queue = deque([source])
+    while queue and (remaining is None or remaining):
+        city = queue.popleft()
+        for neighbor in graph.neighbors(city):
+            if not seen[neighbor]:
+                seen[neighbor] = 1
+                parent[neighbor] = city
+                queue.append(neighbor)
+                if remaining is not None:
+                    remaining.discard(neighbor)
+    return parent
+
+# Answers a list of (start, goal, algorithm) triples and returns one SearchResult per query, in the same order.
+# Shortest path and fewest hop queries that share an origin are all read off one search tree from that origin, grown
+# only until it reaches all of their goals. An origin with a single such query (unless it is ch with no hierarchy
+# given), and every other query, runs on its own through run_query, so a* and ch still get the landmarks and
+# hierarchy, and k shortest gets k. If a RouteCache is given, it is caught up with any road edits, checked first, and
+# filled with the new answers (except k shortest ones). If a SpatialIndex is given, starts and goals can also be
+# (lat, lon) GPS points, which are snapped to the closest city.
+def route_batch(graph, queries, landmarks=None, hierarchy=None, cache=None, max_depth=None, spatial_index=None, k=3):
+    if cache is not None:
+        cache.refresh(graph)
+    if spatial_index is not None:
+        queries = snap_queries(graph, spatial_index, queries)
+    results = [None] * len(queries)
+    by_origin = {}  # (tree kind, origin) -> indexes of the queries answered by that tree
+    missed = []  # indexes of the queries that were not in the cache
+
+    for index, (start, goal, algorithm) in enumerate(queries):
+        algorithm = algorithm.strip().lower()
+        if start not in graph or goal not in graph:
+            raise KeyError(f"'{start if start not in graph else goal}' not found in the road graph")
+        if cache is not None and algorithm not in UNCACHED_ALGORITHMS:
+            results[index] = cache.get(route_key(algorithm, start, goal, max_depth))
+            if results[index] is not None:
+                continue
+            missed.append(index)
+
+        if algorithm in SHORTEST_PATH_ALGORITHMS:
+            by_origin.setdefault(("dijkstra", start), []).append(index)
+        elif algorithm in FEWEST_HOPS_ALGORITHMS:
+            by_origin.setdefault(("bfs", start), []).append(index)
+        else:
+            results[index] = run_query(graph, algorithm, start, goal, landmarks, hierarchy, max_depth, k=k)
+
+    for (kind, origin), indexes in by_origin.items():
+        start, goal, algorithm = queries[indexes[0]]
+        algorithm = algorithm.strip().lower()
+        if len(indexes) == 1 and (algorithm != "ch" or hierarchy is not None):  # a tree only pays off for several goals
+            results[indexes[0]] = run_query(graph, algorithm, start, goal, landmarks, hierarchy, max_depth)
+            continue
+        source = graph.ids[origin]
+        goals = [graph.ids[queries[index][1]] for index in indexes]
+        if kind == "dijkstra":
+            dist, parent = single_source(graph, source, goals)
+        else:
+            parent = bfs_tree(graph, source, goals)
+            dist = None
+        for index in indexes:
+            goal = graph.ids[queries[index][1]]
+            if goal != source and parent[goal] == -1:  # unreachable
+                results[index] = SearchResult(None, math.inf, 0)
+                continue
+            path = path_to(parent, goal)
+            distance = dist[goal] if dist is not None else path_length(graph, path)
+            results[index] = SearchResult(graph.to_names(path), distance, 0)
+
+    if cache is not None:
+        for index in missed:
+            start, goal, algorithm = queries[index]
+            if isinstance(results[index], BudgetExceeded):  # only complete answers are worth remembering
+                continue
+            cache.put(route_key(algorithm.strip().lower(), start, goal, max_depth), results[index])
+
+    return results
+
+def snap_queries(graph, spatial_index, queries):
+    return [(snap_to_city(graph, spatial_index, start), snap_to_city(graph, spatial_index, goal), algorithm)
+            for start, goal, algorithm in queries]
+
+# Full origin x destination matrix, matrix[i][j] is the SearchResult from origins[i] to destinations[j]
+def distance_matrix(graph, origins, destinations, algorithm="dijkstra", landmarks=None, hierarchy=None, cache=None, spatial_index=None):
+    queries = [(origin, destination, algorithm) for origin in origins for destination in destinations]
+    results = route_batch(graph, queries, landmarks, hierarchy, cache, spatial_index=spatial_index)
+    return [results[i * len(destinations):(i + 1) * len(destinations)] for i in range(len(origins))]
+
+# What the worker processes search over: (graph, landmarks, hierarchy, max_depth, k).
+# It is set before the pool starts, so on fork the workers inherit it read-only instead of it being pickled per task.
+_shared = None
+
+def _init_worker(shared):  # only used when the processes are spawned instead of forked, runs once per worker
+    global _shared
+    _shared = shared
+
+def _run_chunk(chunk):
+    graph, landmarks, hierarchy, max_depth, k = _shared
+    return route_batch(graph, chunk, landmarks, hierarchy, max_depth=max_depth, k=k)
+
+# route_batch spread over a process pool for large batches, the results come back in the same order as queries.
+# Queries are sorted by origin before being chunked so each worker can still share search trees inside its chunks.
+def route_batch_parallel(graph, queries, landmarks=None, hierarchy=None, processes=None, chunk_size=None, max_depth=None, spatial_index=None, k=3):
+    global _shared
+    if spatial_index is not None:
+        queries = snap_queries(graph, spatial_index, queries)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(queries) < 2:
+        return route_batch(graph, queries, landmarks, hierarchy, max_depth=max_depth, k=k)
+
+    order = sorted(range(len(queries)), key=lambda index: queries[index][0])
+    chunk_size = chunk_size or max(1, math.ceil(len(queries) / (processes * 4)))  # a few chunks per worker to balance the load
+    chunks = [[queries[index] for index in order[i:i + chunk_size]] for i in range(0, len(order), chunk_size)]
+
+    shared = (graph, landmarks, hierarchy, max_depth, k)
+    if "fork" in multiprocessing.get_all_start_methods():
+        _shared = shared
+        pool = multiprocessing.get_context("fork").Pool(processes)
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(shared,))
+    try:
+        with pool:
+            chunk_results = pool.map(_run_chunk, chunks)
+    finally:
+        _shared = None
+
+    results = [None] * len(queries)
+    position = 0
+    for chunk_result in chunk_results:
+        for result in chunk_result:
+            results[order[position]] = result
+            position += 1
+    return results
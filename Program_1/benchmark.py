@@ -0,0 +1,300 @@
+from array import array
+from collections import deque
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import batch
+import main
+from graph import CityGraph, build_csr_arrays, haversine_radians
+from search_stats import SearchStats
+from shortest_path import BudgetExceeded
+
+KM_PER_DEGREE = 111.195  # km per degree of latitude (and of longitude at the equator)
+BASE_LAT, BASE_LON = 38.5, -98.3  # the synthetic graphs are laid out around the middle of Kansas
+KANSAS_BOUNDS = (36.99, 40.0, -102.05, -94.59)  # south, north, west, east in degrees
+
+# Algorithms the benchmark runs when none are named. "ch" is left out because building the hierarchy is slow on big graphs.
+DEFAULT_ALGORITHMS = ["bfs", "dfs", "iddfs", "best first search", "a*", "dijkstra", "bidirectional bfs", "bidirectional a*", "ida*"]
+
+# Turns km offsets from (BASE_LAT, BASE_LON) into degrees
+def km_to_degrees(x, y):
+    return BASE_LAT + y / KM_PER_DEGREE, BASE_LON + x / (KM_PER_DEGREE * math.cos(math.radians(BASE_LAT)))
+
+# Makes a CityGraph with nodes named n0, n1, ... from coordinates in degrees and undirected (a, b) edge arrays.
+# Every edge is weighted by its haversine length, the same as the real road graph.
+def synthetic_graph(lat, lon, a, b):
+    lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+    lengths = haversine_radians(lat_rad[a], lon_rad[a], lat_rad[b], lon_rad[b])
+    offsets, targets, weights = build_csr_arrays(len(lat), a, b, lengths)
+    names = [f"n{i}" for i in range(len(lat))]
+    lat, lon = (array('d', np.asarray(values, dtype=np.float64).tobytes()) for values in (lat, lon))
+    return CityGraph(names, offsets, targets, weights, lat, lon)
+
+# Square grid of about node_count intersections spaced spacing_km apart, each joined to the 4 next to it
+def grid_graph(node_count, seed=0, spacing_km=1.0):
+    side = max(2, round(math.sqrt(node_count)))
+    row, col = np.divmod(np.arange(side * side), side)
+    lat, lon = km_to_degrees(col * spacing_km, row * spacing_km)
+    node = row * side + col
+    right = node[col < side - 1]
+    up = node[row < side - 1]
+    a = np.concatenate([right, up])
+    b = np.concatenate([right + 1, up + side])
+    return synthetic_graph(lat, lon, a, b)
+
+# Random geometric graph: node_count points spread uniformly over a square (about one per km^2), with a road between
+# every pair closer than radius_km. The default radius gives an average of about 6 roads per node.
+def random_geometric_graph(node_count, seed=0, radius_km=None):
+    rng = np.random.default_rng(seed)
+    side_km = math.sqrt(node_count)
+    radius_km = radius_km or math.sqrt(6 / math.pi)
+    x, y = rng.random(node_count) * side_km, rng.random(node_count) * side_km
+    a, b = pairs_within(x, y, radius_km)
+    lat, lon = km_to_degrees(x, y)
+    return synthetic_graph(lat, lon, a, b)
+
+# Every pair of points closer than radius, each pair once, as two arrays of node ids. The points are bucketed into radius sized cells
+# so only pairs in the same or touching cells are ever compared.
+def pairs_within(x, y, radius):
+    cx, cy = (x // radius).astype(np.int64), (y // radius).astype(np.int64)
+    columns = int(cy.max()) + 2 if len(y) else 1
+    keys = cx * columns + cy
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    nodes = np.arange(len(x))
+
+    found_a, found_b = [], []
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):  # half the neighboring cells, so each pair is seen once
+        other = (cx + dx) * columns + (cy + dy)
+        lo = np.searchsorted(sorted_keys, other, 'left')
+        count = np.searchsorted(sorted_keys, other, 'right') - lo
+        count[(cy + dy) < 0] = 0
+        a = np.repeat(nodes, count)
+        slot = np.arange(len(a)) - np.repeat(np.cumsum(count) - count, count) + np.repeat(lo, count)
+        b = order[slot]
+        keep = (x[a] - x[b])**2 + (y[a] - y[b])**2 < radius * radius
+        if dx == 0 and dy == 0:
+            keep &= a < b
+        found_a.append(a[keep])
+        found_b.append(b[keep])
+    return np.concatenate(found_a), np.concatenate(found_b)
+
+# Kansas shaped road network: towns on a jittered grid filling the state's bounding box (which is about twice as wide
+# as it is tall), joined to their grid neighbors like the section line roads, with some roads missing and a few diagonals.
+def kansas_graph(node_count, seed=0, keep=0.85, diagonals=0.05):
+    rng = np.random.default_rng(seed)
+    south, north, west, east = KANSAS_BOUNDS
+    aspect = (east - west) * math.cos(math.radians((south + north) / 2)) / (north - south)
+    rows = max(2, round(math.sqrt(node_count / aspect)))
+    cols = max(2, round(node_count / rows))
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    lat = south + (row + 0.5 + rng.uniform(-0.35, 0.35, rows * cols)) * (north - south) / rows
+    lon = west + (col + 0.5 + rng.uniform(-0.35, 0.35, rows * cols)) * (east - west) / cols
+    node = row * cols + col
+
+    right = node[col < cols - 1]
+    up = node[row < rows - 1]
+    diagonal = node[(col < cols - 1) & (row < rows - 1)]
+    a = np.concatenate([right, up, diagonal])
+    b = np.concatenate([right + 1, up + cols, diagonal + cols + 1])
+    chance = np.concatenate([np.full(len(right) + len(up), keep), np.full(len(diagonal), diagonals)])
+    built = rng.random(len(a)) < chance
+    return synthetic_graph(lat, lon, a[built], b[built])
+
+GENERATORS = {"grid": grid_graph, "geometric": random_geometric_graph, "kansas": kansas_graph}
+
+# Node ids of the biggest connected piece of the graph, so every benchmark query has an answer
+def largest_component(graph):
+    component = [-1] * len(graph)
+    best, best_size = 0, 0
+    for root in range(len(graph)):
+        if component[root] != -1:
+            continue
+        component[root] = root
+        queue = deque([root])
+        size = 0
+        while queue:
+            node = queue.popleft()
+            size += 1
+            for neighbor in graph.neighbors(node):
+                if component[neighbor] == -1:
+                    component[neighbor] = root
+                    queue.append(neighbor)
+        if size > best_size:
+            best, best_size = root, size
+    return [node for node in range(len(graph)) if component[node] == best]
+
+# query_count (start, goal) city name pairs picked with a fixed seed from the largest component
+def make_queries(graph, query_count, seed=0):
+    rng = random.Random(seed)
+    nodes = largest_component(graph)
+    if len(nodes) < 2:
+        return []
+    return [tuple(graph.names[node] for node in rng.sample(nodes, 2)) for _ in range(query_count)]
+
+def percentiles(values):
+    if not values:
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]).tolist()
+    return {"p50": p50, "p90": p90, "p99": p99, "max": float(max(values)), "mean": float(np.mean(values))}
+
+# Runs every query with one algorithm and sums up the latency (from the SearchStats perf_counter_ns timing),
+# the expansions, the frontier and visited peaks, and the route lengths.
+# The first query is run once untimed to warm up, then every query runs repeats times and its latency is the fastest
+# of those, which takes out most of the noise from the rest of the machine.
+# If measure_memory is set, the queries are run a second time under tracemalloc to get the peak bytes each one allocated,
+# so that the tracing doesn't slow down the timed run.
+def run_algorithm(graph, algorithm, queries, landmarks=None, hierarchy=None, max_depth=None, measure_memory=True, repeats=3):
+    latencies, expansions, frontiers, visited, distances = [], [], [], [], []
+    found = budget_exceeded = 0
+    if queries:
+        batch.run_query(graph, algorithm, queries[0][0], queries[0][1], landmarks, hierarchy, max_depth)
+    for start, goal in queries:
+        fastest = math.inf
+        for _ in range(max(repeats, 1)):
+            stats = SearchStats()
+            result = batch.run_query(graph, algorithm, start, goal, landmarks, hierarchy, max_depth, stats=stats)
+            fastest = min(fastest, stats.elapsed_ns / 1_000)
+        latencies.append(fastest)
+        expansions.append(stats.nodes_expanded)
+        frontiers.append(stats.peak_frontier)
+        visited.append(stats.peak_visited)
+        if isinstance(result, BudgetExceeded):
+            budget_exceeded += 1
+        elif result.path is not None:
+            found += 1
+            distances.append(result.distance)
+
+    summary = {
+        "queries": len(queries),
+        "found": found,
+        "budget_exceeded": budget_exceeded,
+        "latency_us": percentiles(latencies),
+        "expansions": percentiles(expansions),
+        "peak_frontier": percentiles(frontiers),
+        "peak_visited": percentiles(visited),
+        "mean_distance_km": float(np.mean(distances)) if distances else None,
+    }
+
+    if measure_memory:
+        peaks = []
+        tracemalloc.start()
+        try:
+            for start, goal in queries:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                batch.run_query(graph, algorithm, start, goal, landmarks, hierarchy, max_depth)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        summary["peak_memory_bytes"] = percentiles(peaks)
+    return summary
+
+# Builds one synthetic graph and runs every algorithm over the same seeded queries
+def run_graph(generator, node_count, algorithms, query_count, seed, landmark_count=0, max_depth=None, measure_memory=True, repeats=3):
+    build_start = time.perf_counter()
+    graph = GENERATORS[generator](node_count, seed)
+    entry = {"generator": generator, "nodes": len(graph), "edges": len(graph.targets) // 2, "seed": seed,
+             "build_sec": time.perf_counter() - build_start}
+    queries = make_queries(graph, query_count, seed)
+
+    landmarks = hierarchy = None
+    if landmark_count:
+        from landmarks import build_landmarks
+        prep_start = time.perf_counter()
+        landmarks = build_landmarks(graph, landmark_count)
+        entry["landmarks_sec"] = time.perf_counter() - prep_start
+    if "ch" in algorithms:
+        from contraction import build_hierarchy
+        prep_start = time.perf_counter()
+        hierarchy = build_hierarchy(graph)
+        entry["hierarchy_sec"] = time.perf_counter() - prep_start
+
+    entry["results"] = {}
+    for algorithm in algorithms:
+        entry["results"][algorithm] = run_algorithm(graph, algorithm, queries, landmarks, hierarchy, max_depth, measure_memory, repeats)
+        latency = entry["results"][algorithm]["latency_us"]
+        print(f"{generator:>9} {len(graph):>8} {algorithm:>18}  p50 {latency.get('p50', 0):>11.1f} us  "
+              f"p99 {latency.get('p99', 0):>11.1f} us  found {entry['results'][algorithm]['found']}/{len(queries)}", file=sys.stderr)
+    return entry
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Prints how the p50 latency and mean expansions changed from an older results file for every run both files share,
+# and returns the runs whose mean expansions grew by more than threshold. The expansions are the same on every run of
+# the same code, so they are what gets gated on. Latency still moves by tens of percent between runs, even as the
+# fastest of the repeats, so it is only shown. A run where either file hit a search budget isn't gated either, because
+# where a time budget stops a search depends on the machine.
+def compare(old, new, threshold=0.10):
+    old_runs = {(entry["generator"], entry["nodes"], algorithm): result
+                for entry in old["graphs"] for algorithm, result in entry["results"].items()}
+    regressed = []
+    for entry in new["graphs"]:
+        for algorithm, result in entry["results"].items():
+            key = (entry["generator"], entry["nodes"], algorithm)
+            if key not in old_runs or not old_runs[key]["latency_us"] or not result["latency_us"]:
+                continue
+            latency = result["latency_us"]["p50"] / max(old_runs[key]["latency_us"]["p50"], 1e-9)
+            expansions = result["expansions"]["mean"] / max(old_runs[key]["expansions"]["mean"], 1e-9)
+            flag = ""
+            if old_runs[key].get("budget_exceeded") or result.get("budget_exceeded"):
+                flag = "  (hit a budget, not gated)"
+            elif expansions > 1 + threshold:
+                flag = "  MORE EXPANSIONS"
+                regressed.append(key)
+            print(f"{key[0]:>9} {key[1]:>8} {algorithm:>18}  latency x{latency:.2f}  expansions x{expansions:.2f}{flag}")
+    return regressed
+
+if __name__ == "__main__":
+    # python benchmark.py --sizes 100 1000 10000 --generators grid kansas --queries 50 --output bench.json
+    parser = argparse.ArgumentParser(description="Routing benchmark over seeded synthetic road graphs")
+    parser.add_argument("--generators", nargs="+", default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1_000, 10_000], help="node counts, 100 up to 1000000")
+    parser.add_argument("--algorithms", nargs="+", default=DEFAULT_ALGORITHMS, help="menu names, e.g. a* 'best first search' ch")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=main.algo_timeout_sec, help="per query time budget in seconds")
+    parser.add_argument("--max-depth", type=int, default=None, help="iddfs depth limit and IDA* memory ceiling (default: node count / no limit)")
+    parser.add_argument("--landmarks", type=int, default=0, help="ALT landmarks for the A* searches (0 = straight line only)")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs of each query, its latency is the fastest")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory pass")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="older results file to compare against, exits 1 if any run expanded more nodes")
+    args = parser.parse_args()
+
+    main.algo_timeout_sec = args.timeout
+    algorithms = [algorithm.strip().lower() for algorithm in args.algorithms]
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {"queries": args.queries, "seed": args.seed, "timeout_sec": args.timeout,
+                     "max_depth": args.max_depth, "landmarks": args.landmarks, "repeats": args.repeats},
+        "graphs": [run_graph(generator, size, algorithms, args.queries, args.seed, args.landmarks, args.max_depth, not args.no_memory,
+                             args.repeats)
+                   for generator in args.generators for size in args.sizes],
+    }
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as file:
+            sys.exit(1 if compare(json.load(file), results) else 0)
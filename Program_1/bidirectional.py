@@ -0,0 +1,116 @@
+import heapq
+import math
+
+import numpy as np
+
+from shortest_path import BudgetExceeded, SearchResult, partial_result, path_length, path_to
+
+# Joins the forward tree path start -> meet with the backward tree path meet -> goal
+def join_paths(parent_forward, parent_backward, meet):
+    return path_to(parent_forward, meet) + path_to(parent_backward, meet)[::-1][1:]
+
+# Bidirectional breadth first search on node ids, finds a path with the fewest hops.
+# Each round expands one whole layer of whichever side has the smaller frontier. Once the two sides touch,
+# the rest of that layer is still checked so the meeting point with the fewest total hops is used.
+# If a SearchBudget is given and runs out, the result is a BudgetExceeded. If a SearchStats is given it is filled in.
+def bidirectional_bfs(graph, start, goal, budget=None, stats=None):
+    if budget is not None:
+        budget.start()
+    if start == goal:
+        return SearchResult([start], 0.0, 0)
+
+    parent = ([-1] * len(graph), [-1] * len(graph))  # forward and backward search trees
+    depth = ([-1] * len(graph), [-1] * len(graph))  # hops from start / from goal, -1 if not seen yet
+    depth[0][start] = 0
+    depth[1][goal] = 0
+    frontier = ([start], [goal])
+    visited_count = 2  # nodes seen by either side before the current layer
+    nodes_expanded = 0
+
+    while frontier[0] and frontier[1]:
+        side = 0 if len(frontier[0]) <= len(frontier[1]) else 1
+        seen, other_seen, tree = depth[side], depth[1 - side], parent[side]
+        best_hops, meet = math.inf, -1
+        next_layer = []
+
+        for city in frontier[side]:
+            nodes_expanded += 1
+            if budget is not None and budget.spent(len(frontier[0]) + len(frontier[1]) + len(next_layer)):
+                return partial_result(graph, budget, parent[0], np.fromiter(depth[0], dtype=np.int64, count=len(graph)) != -1, goal)
+            if stats is not None:
+                stats.expand(len(frontier[0]) + len(frontier[1]) + len(next_layer), visited_count + len(next_layer), graph.offsets[city + 1] - graph.offsets[city])
+            for neighbor in graph.neighbors(city):
+                if seen[neighbor] == -1:
+                    seen[neighbor] = seen[city] + 1
+                    tree[neighbor] = city
+                    next_layer.append(neighbor)
+                    if other_seen[neighbor] != -1 and seen[neighbor] + other_seen[neighbor] < best_hops:
+                        best_hops, meet = seen[neighbor] + other_seen[neighbor], neighbor
+
+        if meet != -1:
+            path = join_paths(parent[0], parent[1], meet)
+            return SearchResult(path, path_length(graph, path), nodes_expanded)
+        frontier = (next_layer, frontier[1]) if side == 0 else (frontier[0], next_layer)
+        visited_count += len(next_layer)
+
+    return SearchResult(None, math.inf, nodes_expanded)
+
+# Bidirectional A* on the weighted graph (the symmetric version).
+# The forward search runs from start with to_goal(node) as its heuristic and the backward search runs from goal
+# with to_start(node); both have to be consistent lower bounds (haversine and ALT are).
+# If a SearchBudget is given and runs out, the result is a BudgetExceeded. If a SearchStats is given it is filled in.
+# mu is the shortest start -> goal path seen where the two searches touch. Any shorter path would have to pass through
+# an unsettled node on each side whose key is below mu, so once either frontier's smallest key reaches mu, mu is optimal.
+def bidirectional_a_star(graph, start, goal, to_goal, to_start, budget=None, stats=None):
+    if budget is not None:
+        budget.start()
+    if stats is not None:
+        stats.heap_pushes += 2
+    dist = ([math.inf] * len(graph), [math.inf] * len(graph))
+    parent = ([-1] * len(graph), [-1] * len(graph))
+    closed = (bytearray(len(graph)), bytearray(len(graph)))
+    heuristic = (to_goal, to_start)
+    dist[0][start] = 0.0
+    dist[1][goal] = 0.0
+    frontier = ([(to_goal(start), 0.0, start)], [(to_start(goal), 0.0, goal)])
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    mu, meet = (0.0, start) if start == goal else (math.inf, -1)
+    nodes_expanded = 0
+
+    while frontier[0] and frontier[1]:
+        if max(frontier[0][0][0], frontier[1][0][0]) >= mu:  # no unsettled node can lead to a shorter path
+            break
+
+        side = 0 if frontier[0][0][0] <= frontier[1][0][0] else 1  # expand the side with the smaller key
+        _, cost, current = heapq.heappop(frontier[side])
+        if stats is not None:
+            stats.heap_pops += 1
+        if closed[side][current] or cost > dist[side][current]:  # stale entry
+            continue
+        if budget is not None and budget.spent(len(frontier[0]) + len(frontier[1])):
+            if meet != -1:  # the searches already touched, so the best progress is a complete (maybe not shortest) route
+                return BudgetExceeded(join_paths(parent[0], parent[1], meet), mu, budget.expansions, budget.reason)
+            closed[0][start] = 1  # counts as explored for the partial path
+            return partial_result(graph, budget, parent[0], closed[0], goal)
+        closed[side][current] = 1
+        nodes_expanded += 1
+        if stats is not None:
+            stats.expand(len(frontier[0]) + len(frontier[1]), nodes_expanded, offsets[current + 1] - offsets[current])
+        my_dist, other_dist, h = dist[side], dist[1 - side], heuristic[side]
+
+        for i in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[i]
+            new_cost = cost + weights[i]
+            if new_cost < my_dist[neighbor] and not closed[side][neighbor]:
+                my_dist[neighbor] = new_cost
+                parent[side][neighbor] = current
+                heapq.heappush(frontier[side], (new_cost + h(neighbor), new_cost, neighbor))
+                if stats is not None:
+                    stats.heap_pushes += 1
+            if my_dist[neighbor] + other_dist[neighbor] < mu:  # the two searches touch at neighbor
+                mu = my_dist[neighbor] + other_dist[neighbor]
+                meet = neighbor
+
+    if meet == -1:
+        return SearchResult(None, math.inf, nodes_expanded)
+    return SearchResult(join_paths(parent[0], parent[1], meet), mu, nodes_expanded)
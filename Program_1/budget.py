@@ -0,0 +1,42 @@
+import math
+import time
+
+# Limits for one search: wall clock seconds, node expansions, and frontier size (None means no limit).
+# The search calls spent() once per expansion. That is one add and two compares in the common case; the clock is
+# only read every CLOCK_EVERY expansions.
+class SearchBudget:
+    CLOCK_EVERY = 64
+
+    def __init__(self, timeout_sec=None, max_expansions=None, max_frontier=None):
+        self.timeout_sec = timeout_sec
+        self.max_expansions = max_expansions
+        self.max_frontier = max_frontier if max_frontier is not None else math.inf
+        self.start()
+
+    def start(self):  # called by the search when it begins, so one budget can be reused for many searches
+        self.deadline = time.perf_counter() + self.timeout_sec if self.timeout_sec is not None else math.inf
+        self.expansions = 0
+        self.reason = None
+        self.next_check = self.CLOCK_EVERY if self.timeout_sec is not None else math.inf
+        if self.max_expansions is not None:
+            self.next_check = min(self.next_check, self.max_expansions + 1)
+
+    def spent(self, frontier_size):  # counts one expansion, True once any limit is hit
+        self.expansions += 1
+        if self.expansions < self.next_check and frontier_size <= self.max_frontier:
+            return False
+        return self._check(frontier_size)
+
+    def _check(self, frontier_size):
+        if frontier_size > self.max_frontier:
+            self.reason = "frontier"
+        elif self.max_expansions is not None and self.expansions > self.max_expansions:
+            self.reason = "expansions"
+        elif time.perf_counter() > self.deadline:
+            self.reason = "time"
+        else:
+            self.next_check = self.expansions + self.CLOCK_EVERY
+            if self.max_expansions is not None:
+                self.next_check = min(self.next_check, self.max_expansions + 1)
+            return False
+        return True
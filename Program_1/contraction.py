@@ -0,0 +1,266 @@
+from array import array
+import heapq
+import math
+import os
+import struct
+
+from graph import graph_fingerprint
+from shortest_path import SearchResult
+
+HIERARCHY_MAGIC = b'CH01'
+WITNESS_SETTLE_LIMIT = 500  # how many nodes a witness search may settle before giving up (and adding the shortcut anyway)
+
+# Contraction hierarchy over the weighted CityGraph.
+# Every node has a rank (the order it was contracted in), and the upward graph is stored in CSR arrays: the edges of
+# node v go to neighbors with a higher rank. An edge with middle != -1 is a shortcut for the two edges middle - v and
+# middle - target, and the middle always has a lower rank than both ends, so both of those edges are in middle's upward list.
+class ContractionHierarchy:
+    def __init__(self, rank, offsets, targets, weights, middles, fingerprint):
+        self.rank = rank
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.middles = middles
+        self.fingerprint = fingerprint  # fingerprint of the graph the hierarchy was built for
+
+    def __len__(self):
+        return len(self.rank)
+
+    def find_edge(self, low, high):  # index of the upward edge low -> high
+        for i in range(self.offsets[low], self.offsets[low + 1]):
+            if self.targets[i] == high:
+                return i
+        raise KeyError((low, high))
+
+    # Expands the upward edge at index i (from low to targets[i]) back into the original nodes strictly between its ends
+    def unpack(self, low, i):
+        middle = self.middles[i]
+        if middle == -1:  # an original road
+            return []
+        high = self.targets[i]
+        left = self.unpack(middle, self.find_edge(middle, low))[::-1]  # low -> middle
+        right = self.unpack(middle, self.find_edge(middle, high))  # middle -> high
+        return left + [middle] + right
+
+# Remaining-graph helper for the build: shortest distance from source to each target, not going through skip,
+# stopping at max_cost or after WITNESS_SETTLE_LIMIT settled nodes
+def witness_search(adjacency, source, skip, targets, max_cost):
+    dist = {source: 0.0}
+    frontier = [(0.0, source)]
+    settled = 0
+    remaining = set(targets)
+
+    while frontier and remaining and settled < WITNESS_SETTLE_LIMIT:
+        cost, current = heapq.heappop(frontier)
+        if cost > dist[current]:
+            continue
+        if cost > max_cost:
+            break
+        settled += 1
+        remaining.discard(current)
+
+        for neighbor, (weight, _) in adjacency[current].items():
+            if neighbor == skip:
+                continue
+            new_cost = cost + weight
+            if new_cost < dist.get(neighbor, math.inf):
+                dist[neighbor] = new_cost
+                heapq.heappush(frontier, (new_cost, neighbor))
+
+    return dist
+
+# Shortcuts (u, w, weight) needed if node was contracted now: one for every pair of remaining neighbors whose best
+# route without node is longer than the route through it
+def needed_shortcuts(adjacency, node):
+    neighbors = list(adjacency[node].items())
+    shortcuts = []
+    for index, (u, (weight_u, _)) in enumerate(neighbors):
+        others = neighbors[index + 1:]
+        if not others:
+            continue
+        max_cost = weight_u + max(weight_w for _, (weight_w, _) in others)
+        dist = witness_search(adjacency, u, node, [w for w, _ in others], max_cost)
+        for w, (weight_w, _) in others:
+            via = weight_u + weight_w
+            if dist.get(w, math.inf) > via:
+                shortcuts.append((u, w, via))
+    return shortcuts
+
+# Contraction order priority: edge difference (shortcuts added minus edges removed) plus the number of neighbors
+# already contracted, which keeps the contraction spread evenly over the map
+def node_priority(adjacency, contracted_neighbors, node):
+    return len(needed_shortcuts(adjacency, node)) - len(adjacency[node]) + contracted_neighbors[node]
+
+# Offline preprocessing: orders the nodes, contracts them one at a time inserting shortcuts, and returns the hierarchy
+def build_hierarchy(graph):
+    node_count = len(graph)
+    adjacency = [dict() for _ in range(node_count)]  # remaining graph: neighbor -> (weight, middle)
+    for node in range(node_count):
+        for neighbor, weight in graph.edges(node):
+            if neighbor != node and weight < adjacency[node].get(neighbor, (math.inf, -1))[0]:
+                adjacency[node][neighbor] = (weight, -1)
+
+    contracted_neighbors = [0] * node_count
+    rank = array('q', [0]) * node_count
+    upward = [None] * node_count  # upward edges of each node, filled in as it is contracted
+    queue = [(node_priority(adjacency, contracted_neighbors, node), node) for node in range(node_count)]
+    heapq.heapify(queue)
+    order = 0
+
+    while queue:
+        _, node = heapq.heappop(queue)
+        # Lazy update: priorities go stale as neighbors get contracted, so recompute and requeue if it is no longer the smallest
+        priority = node_priority(adjacency, contracted_neighbors, node)
+        if queue and priority > queue[0][0]:
+            heapq.heappush(queue, (priority, node))
+            continue
+
+        for u, w, weight in needed_shortcuts(adjacency, node):
+            if weight < adjacency[u].get(w, (math.inf, -1))[0]:
+                adjacency[u][w] = (weight, node)
+                adjacency[w][u] = (weight, node)
+
+        rank[node] = order
+        order += 1
+        upward[node] = [(neighbor, weight, middle) for neighbor, (weight, middle) in adjacency[node].items()]
+        for neighbor in adjacency[node]:  # take node out of the remaining graph
+            del adjacency[neighbor][node]
+            contracted_neighbors[neighbor] += 1
+        adjacency[node] = {}
+
+    offsets = array('q', [0]) * (node_count + 1)
+    targets, weights, middles = array('q'), array('d'), array('q')
+    for node in range(node_count):
+        for neighbor, weight, middle in upward[node]:
+            targets.append(neighbor)
+            weights.append(weight)
+            middles.append(middle)
+        offsets[node + 1] = len(targets)
+
+    return ContractionHierarchy(rank, offsets, targets, weights, middles, graph_fingerprint(graph))
+
+# Bidirectional upward Dijkstra query. Both searches only follow edges to higher ranked nodes (the backward search is
+# the same upward search from goal since roads are undirected), and the best path meets at its highest ranked node.
+# Each side stops once its smallest key reaches the best meeting cost. The path is unpacked back to the original nodes.
+# If a SearchStats is given it is filled in.
+def hierarchy_query(hierarchy, start, goal, stats=None):
+    offsets, targets, weights = hierarchy.offsets, hierarchy.targets, hierarchy.weights
+    if stats is not None:
+        stats.heap_pushes += 2
+    dist = ({start: 0.0}, {goal: 0.0})
+    parent_edge = ({start: -1}, {goal: -1})  # index of the upward edge each node was reached through
+    parent = ({start: -1}, {goal: -1})
+    frontier = ([(0.0, start)], [(0.0, goal)])
+    best, meet = math.inf, -1
+    nodes_expanded = 0
+
+    while frontier[0] or frontier[1]:
+        for side in (0, 1):
+            if not frontier[side]:
+                continue
+            cost, current = heapq.heappop(frontier[side])
+            if stats is not None:
+                stats.heap_pops += 1
+            if cost >= best:  # nothing left on this side can improve the meeting cost
+                frontier[side].clear()
+                continue
+            if cost > dist[side][current]:  # stale entry
+                continue
+            nodes_expanded += 1
+            if stats is not None:
+                stats.expand(len(frontier[0]) + len(frontier[1]), len(dist[0]) + len(dist[1]), offsets[current + 1] - offsets[current])
+
+            other = dist[1 - side].get(current)
+            if other is not None and cost + other < best:
+                best, meet = cost + other, current
+
+            for i in range(offsets[current], offsets[current + 1]):
+                neighbor = targets[i]
+                new_cost = cost + weights[i]
+                if new_cost < dist[side].get(neighbor, math.inf):
+                    dist[side][neighbor] = new_cost
+                    parent[side][neighbor] = current
+                    parent_edge[side][neighbor] = i
+                    heapq.heappush(frontier[side], (new_cost, neighbor))
+                    if stats is not None:
+                        stats.heap_pushes += 1
+
+    if meet == -1:
+        return SearchResult(None, math.inf, nodes_expanded)
+
+    halves = []
+    for side in (0, 1):  # the upward path from each end to meet, with every shortcut expanded
+        nodes = [meet]
+        node = meet
+        while parent[side][node] != -1:
+            low = parent[side][node]
+            nodes.extend(hierarchy.unpack(low, parent_edge[side][node])[::-1])
+            nodes.append(low)
+            node = low
+        halves.append(nodes[::-1])  # end -> meet
+
+    return SearchResult(halves[0] + halves[1][::-1][1:], best, nodes_expanded)
+
+# File layout: magic, node count, edge count, graph fingerprint, then rank, offsets, targets, middles (int64) and weights (float64)
+def save_hierarchy(hierarchy, filename):
+    temp_filename = filename + ".tmp"  # write to the side and rename so a reader never sees half a file
+    with open(temp_filename, 'wb') as file:
+        file.write(HIERARCHY_MAGIC)
+        file.write(struct.pack('<IIL', len(hierarchy), len(hierarchy.targets), hierarchy.fingerprint))
+        for values in (hierarchy.rank, hierarchy.offsets, hierarchy.targets, hierarchy.middles):
+            values.tofile(file)
+        hierarchy.weights.tofile(file)
+    os.replace(temp_filename, filename)
+
+# Loads a hierarchy saved by save_hierarchy, returns None if the file is missing, damaged, or was built for a different graph
+def load_hierarchy(filename, graph):
+    try:
+        with open(filename, 'rb') as file:
+            if file.read(4) != HIERARCHY_MAGIC:
+                return None
+            node_count, edge_count, fingerprint = struct.unpack('<IIL', file.read(struct.calcsize('<IIL')))
+            if node_count != len(graph) or fingerprint != graph_fingerprint(graph):
+                return None
+            columns = []
+            for count in (node_count, node_count + 1, edge_count, edge_count):
+                values = array('q')
+                values.fromfile(file, count)
+                columns.append(values)
+            weights = array('d')
+            weights.fromfile(file, edge_count)
+    except (OSError, EOFError, struct.error):
+        return None
+
+    rank, offsets, targets, middles = columns
+    return ContractionHierarchy(rank, offsets, targets, weights, middles, fingerprint)
+
+# Loads the hierarchy for graph from filename, building and saving it first if it is missing or out of date
+def get_hierarchy(graph, filename):
+    hierarchy = load_hierarchy(filename, graph)
+    if hierarchy is None:
+        hierarchy = build_hierarchy(graph)
+        try:
+            save_hierarchy(hierarchy, filename)
+        except OSError:
+            pass  # read only directory, just build it again next time
+    return hierarchy
+
+# A shortcut can stand for any road, so after road edits the hierarchy is only kept if the graph's edges are
+# exactly the ones it was built for (an edit that was undone), otherwise it is rebuilt
+def refresh_hierarchy(hierarchy, graph):
+    if hierarchy.fingerprint != graph_fingerprint(graph):
+        return build_hierarchy(graph)
+    return hierarchy
+
+if __name__ == "__main__":
+    # Offline build: python contraction.py [adjacencies.txt] [coordinates.csv] [hierarchy.bin]
+    import sys
+    from graph import create_city_graph, create_coordinate_dict
+
+    args = sys.argv[1:] + [None] * 3
+    adjacencies_txt = args[0] or 'adjacencies.txt'
+    coordinates_csv = args[1] or 'coordinates.csv'
+    hierarchy_bin = args[2] or 'hierarchy.bin'
+    city_graph = create_city_graph(adjacencies_txt, create_coordinate_dict(coordinates_csv))
+    save_hierarchy(build_hierarchy(city_graph), hierarchy_bin)
+    print(f"Wrote {hierarchy_bin}")
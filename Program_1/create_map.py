@@ -1,9 +1,11 @@
-import tkinter as tk
-from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import matplotlib
-matplotlib.use('TkAgg')
+# Only matplotlib's drawing classes are imported here. tkinter, pyplot and the TkAgg backend are imported the first
+# time a window is opened, so importing this module (or exporting maps with export_map) works without a display.
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+import numpy as np
+
+MAX_LABELS = 60  # most city names drawn at once, the rest are culled until you zoom in
+LABEL_CELLS = 8  # the view is split into LABEL_CELLS x LABEL_CELLS cells and each cell gets at most one name
 
 # City connections
 connections = [
@@ -74,10 +76,79 @@ connections = [
     ("Newton", "El_Dorado")
 ]
 
+# Looks up the (lon, lat) ends of every connection whose two cities are both in cities, once, as the (E, 2, 2)
+# segment array a LineCollection takes
+def connection_segments(cities, edges):
+    segments = [(cities[city1][::-1], cities[city2][::-1]) for city1, city2 in edges if city1 in cities and city2 in cities]
+    return np.array(segments, dtype=float).reshape(-1, 2, 2)
+
+# Draws the network onto ax as one LineCollection for every connection and one scatter for every city, so the
+# cost of a redraw doesn't grow with the number of matplotlib artists. Returns the CityLabels that keep the names culled.
+def draw_network(ax, cities, edges):
+    names = list(cities)
+    lat, lon = np.array([cities[city] for city in names], dtype=float).reshape(-1, 2).T
+    ax.add_collection(LineCollection(connection_segments(cities, edges), colors='b', linewidths=0.5, alpha=0.5))
+    ax.scatter(lon, lat, s=25, c='r', zorder=2)
+    ax.autoscale_view()
+    return CityLabels(ax, names, lat, lon)
+
+# City names for the part of the map in view. Whenever the view changes (zoom or pan) the old names are removed and
+# only the cities in view are labeled, and if there are more than MAX_LABELS of them just one per grid cell of the view.
+class CityLabels:
+    def __init__(self, ax, names, lat, lon):
+        self.ax = ax
+        self.names = names
+        self.lat = lat
+        self.lon = lon
+        self.texts = []
+        self.view = None
+        ax.callbacks.connect('xlim_changed', self.update)
+        ax.callbacks.connect('ylim_changed', self.update)
+        self.update(ax)
+
+    def update(self, ax):
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        if (x0, x1, y0, y1) == self.view:  # a zoom changes both limits, only relabel once
+            return
+        self.view = (x0, x1, y0, y1)
+        for text in self.texts:
+            text.remove()
+
+        lon, lat = self.lon, self.lat
+        shown = np.flatnonzero((lon >= min(x0, x1)) & (lon <= max(x0, x1)) & (lat >= min(y0, y1)) & (lat <= max(y0, y1)))
+        if len(shown) > MAX_LABELS:
+            column = np.clip(((lon[shown] - x0) / (x1 - x0) * LABEL_CELLS).astype(int), 0, LABEL_CELLS - 1)
+            row = np.clip(((lat[shown] - y0) / (y1 - y0) * LABEL_CELLS).astype(int), 0, LABEL_CELLS - 1)
+            _, first = np.unique(column * LABEL_CELLS + row, return_index=True)
+            shown = shown[np.sort(first)][:MAX_LABELS]
+        self.texts = [self.ax.annotate(self.names[i], (lon[i], lat[i]), xytext=(5, 5), textcoords='offset points', fontsize=8)
+                      for i in shown]
+
+# Renders the map straight to an image file with no window, the format comes from the extension (.png, .svg, .pdf, ...).
+# route is an optional list of city names drawn on top as one thick line.
+def export_map(cities, filename, edges=None, route=None, title='City Connections Map', size=(10, 8), dpi=100):
+    fig = Figure(figsize=size)
+    ax = fig.add_subplot()
+    draw_network(ax, cities, edges if edges is not None else connections)
+    if route:
+        lat, lon = np.array([cities[city] for city in route], dtype=float).reshape(-1, 2).T
+        ax.plot(lon, lat, 'r-', linewidth=2.5, zorder=3)
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.set_title(title)
+    ax.grid(True)
+    fig.savefig(filename, dpi=dpi, bbox_inches='tight')
+
 class CityConnectionsGUI:
-    def __init__(self, master, cities):
+    def __init__(self, master, cities, edges=None):
+        from tkinter import ttk
+        import tkinter as tk
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
         self.master = master
         self.cities = cities
+        self.edges = edges if edges is not None else connections  # (city1, city2) pairs to draw between the cities
         master.title("City Connections Map")
 
         # Create a frame to hold the canvas and toolbar
@@ -101,17 +172,8 @@ class CityConnectionsGUI:
     def plot_map(self):
         self.ax.clear()
 
-        # Plot cities
-        for city, (lat, lon) in self.cities.items():
-            self.ax.plot(lon, lat, 'ro', markersize=5)
-            self.ax.annotate(city, (lon, lat), xytext=(5, 5), textcoords='offset points', fontsize=8)
-
-        # Plot connections (only for cities that are in the given subset)
-        for city1, city2 in connections:
-            if city1 in self.cities and city2 in self.cities:
-                lon1, lat1 = self.cities[city1][1], self.cities[city1][0]
-                lon2, lat2 = self.cities[city2][1], self.cities[city2][0]
-                self.ax.plot([lon1, lon2], [lat1, lat2], 'b-', linewidth=0.5, alpha=0.5)
+        # Plot the connections and cities in one artist each, the city names are culled to the part in view
+        self.labels = draw_network(self.ax, self.cities, self.edges)
 
         self.ax.set_xlabel('Longitude')
         self.ax.set_ylabel('Latitude')
@@ -119,11 +181,16 @@ class CityConnectionsGUI:
         self.ax.grid(True)
         self.canvas.draw()
 
-def main(cities):
+def main(cities, edges=None):
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    import tkinter as tk
+
     global sample_cities
     sample_cities = cities
     root = tk.Tk()
-    gui = CityConnectionsGUI(root, cities)
+    gui = CityConnectionsGUI(root, cities, edges)
     
     # Handle window close event
     def on_closing():
@@ -133,3 +200,16 @@ def main(cities):
 
     root.protocol("WM_DELETE_WINDOW", on_closing)
     root.mainloop()
+
+if __name__ == "__main__":
+    # Headless export of the whole road network: python create_map.py network.png [adjacencies.txt] [coordinates.csv]
+    import sys
+    from graph_cache import load_city_graph
+
+    args = sys.argv[1:] + [None] * 3
+    filename = args[0] or 'network.png'
+    city_graph = load_city_graph(args[1] or 'adjacencies.txt', args[2] or 'coordinates.csv')
+    cities = {city: city_graph.coordinates(city) for city in city_graph.names}
+    roads = [(city_graph.names[a], city_graph.names[b]) for a in range(len(city_graph)) for b in city_graph.neighbors(a) if a < b]
+    export_map(cities, filename, roads)
+    print(f"Wrote {filename}")
@@ -0,0 +1,233 @@
+from array import array
+import math
+import zlib
+
+import numpy as np
+
+R = 6371  # radius of earth in km
+
+# Haversine distance in km between two (lat, lon) points given in degrees
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    return R * 2 * math.asin(math.sqrt(a))
+
+# Vectorized haversine in km, the arguments are radian numpy arrays (or scalars) that broadcast against each other
+def haversine_radians(lat1, lon1, lat2, lon2):
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return R * 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+# Road graph where every city name is interned to an int once, and the neighbors are stored in flat CSR arrays.
+# The neighbors of node i are targets[offsets[i]:offsets[i + 1]] and weights holds the cost of each of those edges.
+class CityGraph:
+    def __init__(self, names, offsets, targets, weights, lat, lon):
+        self.names = names  # id -> city name
+        self.ids = {name: i for i, name in enumerate(names)}  # city name -> id
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.lat = lat  # latitude of each node in degrees (nan if the city has no coordinates)
+        self.lon = lon
+        self.lat_rad = np.radians(np.asarray(lat, dtype=np.float64))  # radians, converted once here for the vectorized haversine
+        self.lon_rad = np.radians(np.asarray(lon, dtype=np.float64))
+        self.changes = []  # (a, b, old weight, new weight) for every road edit since the graph was built, inf means no road
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):  # arrays memory mapped from graph.bin can't be pickled, so send plain array copies instead
+        state = self.__dict__.copy()
+        state.pop('buffer', None)
+        own_arrays(state)
+        return state
+
+    def __contains__(self, city):
+        return city in self.ids
+
+    def neighbors(self, node):  # ids of the nodes next to node
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def edges(self, node):  # (neighbor, weight) pairs leaving node
+        lo, hi = self.offsets[node], self.offsets[node + 1]
+        return zip(self.targets[lo:hi], self.weights[lo:hi])
+
+    def distance(self, a, b):  # straight line distance in km between two node ids
+        return haversine(self.lat[a], self.lon[a], self.lat[b], self.lon[b])
+
+    def distances_to(self, goal, nodes=None):  # straight line km from every node (or just nodes) to goal, in one vectorized pass
+        lat, lon = (self.lat_rad, self.lon_rad) if nodes is None else (self.lat_rad[nodes], self.lon_rad[nodes])
+        return haversine_radians(lat, lon, self.lat_rad[goal], self.lon_rad[goal])
+
+    # Per query heuristic table: heuristic_table(goal)[node] is the straight line km from node to goal.
+    # A plain list, because indexing it from the search loops is much cheaper than indexing a numpy array.
+    def heuristic_table(self, goal):
+        return self.distances_to(goal).tolist()
+
+    def route_distance(self, path):  # straight line km along a path of ids, summed in one vectorized pass
+        if len(path) < 2:
+            return 0.0
+        path = np.asarray(path, dtype=np.int64)
+        lat, lon = self.lat_rad[path], self.lon_rad[path]
+        return float(haversine_radians(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+    def coordinates(self, city):  # (lat, lon) of a city name
+        node = self.ids[city]
+        return self.lat[node], self.lon[node]
+
+    def to_names(self, path):  # translate a path of ids back into city names
+        return [self.names[node] for node in path]
+
+    def find_edge(self, a, b):  # slot of the edge a -> b in targets and weights, -1 if there is no road
+        for i in range(self.offsets[a], self.offsets[a + 1]):
+            if self.targets[i] == b:
+                return i
+        return -1
+
+    # Road edits on the live graph. Every edit is logged in changes, so the indexes and caches built on the graph can
+    # catch up on just the roads that changed (see LifelongPlanner, refresh_landmarks and RouteCache.refresh).
+    # set_road adds the road a - b or changes its length, by default to the straight line distance. A road can't be
+    # shorter than the straight line, or the haversine heuristic every A* search uses would overestimate.
+    def set_road(self, a, b, weight=None):
+        straight = self.distance(a, b)
+        weight = straight if weight is None else weight
+        if a == b or weight < straight - 1e-9:
+            raise ValueError(f"A road from {self.names[a]} to {self.names[b]} can't be {weight} km long")
+        old = self._set_edge(a, b, weight)
+        self._set_edge(b, a, weight)
+        self.changes.append((a, b, old, weight))
+
+    def remove_road(self, a, b):  # closes the road a - b
+        if self.find_edge(a, b) == -1:
+            raise KeyError(f"No road from {self.names[a]} to {self.names[b]}")
+        old = self._remove_edge(a, b)
+        self._remove_edge(b, a)
+        self.changes.append((a, b, old, math.inf))
+
+    def _set_edge(self, a, b, weight):  # returns the old weight, inf if the edge is new
+        own_arrays(self.__dict__)
+        i = self.find_edge(a, b)
+        if i != -1:
+            old, self.weights[i] = self.weights[i], weight
+            return old
+        i = self.offsets[a + 1]  # new edges go at the end of a's neighbors
+        self.targets.insert(i, b)
+        self.weights.insert(i, weight)
+        self._shift_offsets(a, 1)
+        return math.inf
+
+    def _remove_edge(self, a, b):
+        own_arrays(self.__dict__)
+        i = self.find_edge(a, b)
+        old = self.weights[i]
+        del self.targets[i]
+        del self.weights[i]
+        self._shift_offsets(a, -1)
+        return old
+
+    def _shift_offsets(self, node, step):  # every node after node starts step slots later
+        view = np.frombuffer(self.offsets, dtype=np.int64)
+        view[node + 1:] += step
+        del view  # the array can't be resized while a view of it is alive
+
+# Turns the CSR and coordinate arrays in a graph's __dict__ into plain arrays, if they are views of a memory mapped
+# graph.bin (which are read only and can't be pickled or resized)
+def own_arrays(state):
+    for key, typecode in (('offsets', 'q'), ('targets', 'q'), ('weights', 'd'), ('lat', 'd'), ('lon', 'd')):
+        if not isinstance(state[key], array):
+            state[key] = array(typecode, state[key])
+
+# Cheap fingerprint of the graph's edges so files built for another graph (landmarks, hierarchies) are not reused
+def graph_fingerprint(graph):
+    crc = zlib.crc32(graph.offsets.tobytes())
+    crc = zlib.crc32(graph.targets.tobytes(), crc)
+    return zlib.crc32(graph.weights.tobytes(), crc)
+
+# Takes in the coordinates of the cities and creates a dictionary with the city as the key and the (lat, lon) as the value
+def create_coordinate_dict(filename):
+    coordinate_dict = {}
+
+    with open(filename, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            city, lat, lon = line.strip().split(",")
+            coordinate_dict[city] = (float(lat), float(lon))
+
+    return coordinate_dict
+
+# Builds the CSR arrays from a list of undirected (a, b, weight) edges over node ids
+def build_csr(node_count, edge_list):
+    degree = [0] * node_count
+    for a, b, _ in edge_list:
+        degree[a] += 1
+        degree[b] += 1
+
+    offsets = array('q', [0]) * (node_count + 1)
+    for node in range(node_count):
+        offsets[node + 1] = offsets[node] + degree[node]
+
+    targets = array('q', [0]) * offsets[node_count]
+    weights = array('d', [0.0]) * offsets[node_count]
+    fill = list(offsets[:node_count])  # next free slot for each node
+    for a, b, weight in edge_list:
+        targets[fill[a]], weights[fill[a]] = b, weight
+        fill[a] += 1
+        targets[fill[b]], weights[fill[b]] = a, weight
+        fill[b] += 1
+
+    return offsets, targets, weights
+
+# Same CSR arrays as build_csr, but from numpy arrays of edge endpoints and weights, for graphs too big to loop over.
+# Each node's edges come out in the same order build_csr would give them.
+def build_csr_arrays(node_count, a, b, weight):
+    sources = np.stack([a, b], axis=1).ravel()  # each road in both directions, in edge order
+    ends = np.stack([b, a], axis=1).ravel()
+    lengths = np.repeat(weight, 2)
+    order = np.argsort(sources, kind='stable')
+
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=offsets[1:])
+    return (array('q', offsets.tobytes()), array('q', ends[order].astype(np.int64).tobytes()),
+            array('d', lengths[order].astype(np.float64).tobytes()))
+
+# Takes in the adjacencies file and the coordinate dict and creates the CityGraph
+def create_city_graph(filename, coordinate_dict):
+    names = []
+    ids = {}
+    edges = {}  # (low id, high id) -> None, a dict so the roads keep their file order
+
+    def intern(city):  # gives each city name an id the first time it is seen
+        if city not in ids:
+            ids[city] = len(names)
+            names.append(city)
+        return ids[city]
+
+    with open(filename, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            city1, city2 = line.strip().split()
+            a, b = intern(city1), intern(city2)
+            if a != b:
+                edges.setdefault((min(a, b), max(a, b)))  # the file can list a road in both directions, only keep it once
+
+    lat = array('d', [math.nan]) * len(names)
+    lon = array('d', [math.nan]) * len(names)
+    for city, node in ids.items():
+        if city in coordinate_dict:
+            lat[node], lon[node] = coordinate_dict[city]
+
+    # Weight every road by its haversine length once here so the searches never recompute it
+    pairs = np.array(list(edges), dtype=np.int64).reshape(-1, 2)  # file order, so neighbors keep the order the searches tie-break on
+    lat_rad, lon_rad = np.radians(np.asarray(lat)), np.radians(np.asarray(lon))
+    missing = np.isnan(lat_rad[pairs.ravel()])
+    if missing.any():
+        raise ValueError(f"Coordinates not found for {names[pairs.ravel()[missing.argmax()]]}")
+    a, b = pairs[:, 0], pairs[:, 1]
+    lengths = haversine_radians(lat_rad[a], lon_rad[a], lat_rad[b], lon_rad[b])
+    edge_list = list(zip(a.tolist(), b.tolist(), lengths.tolist()))
+    offsets, targets, weights = build_csr(len(names), edge_list)
+    return CityGraph(names, offsets, targets, weights, lat, lon)
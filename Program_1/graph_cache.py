@@ -0,0 +1,83 @@
+from array import array
+import mmap
+import os
+import struct
+
+from graph import CityGraph, create_city_graph, create_coordinate_dict
+
+CACHE_MAGIC = b'CGR2'  # bumped when the layout or the neighbor order changes, so old files get rebuilt
+# magic, node count, edge count, length of the names blob, then (mtime_ns, size) of adjacencies.txt and coordinates.csv
+CACHE_HEADER = struct.Struct('<4sQQQqQqQ')
+HEADER_SIZE = 64  # header padded so the 8 byte arrays after it stay aligned
+
+# (mtime_ns, size) of a source file, the cache is rebuilt whenever either changes
+def source_stamp(filename):
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+# Compiled graph file: the header, then offsets (int64), targets (int64), weights, lat, lon (float64),
+# and finally the city names as one utf-8 blob separated by newlines
+def save_graph_cache(graph, filename, adjacencies_file, coordinates_file):
+    names_blob = "\n".join(graph.names).encode("utf-8")
+    header = CACHE_HEADER.pack(CACHE_MAGIC, len(graph), len(graph.targets), len(names_blob),
+                               *source_stamp(adjacencies_file), *source_stamp(coordinates_file))
+
+    temp_filename = filename + ".tmp"  # write to the side and rename so a reader never sees half a file
+    with open(temp_filename, 'wb') as file:
+        file.write(header.ljust(HEADER_SIZE, b'\0'))
+        for values, typecode in ((graph.offsets, 'q'), (graph.targets, 'q'), (graph.weights, 'd'), (graph.lat, 'd'), (graph.lon, 'd')):
+            array(typecode, values).tofile(file)
+        file.write(names_blob)
+    os.replace(temp_filename, filename)
+
+# Memory maps a graph saved by save_graph_cache. The CSR and coordinate arrays are views straight into the mapped
+# file, so nothing is parsed or copied except the names. Returns None if the file is missing, damaged, or older
+# than the text files it was built from.
+def load_graph_cache(filename, adjacencies_file, coordinates_file):
+    try:
+        with open(filename, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # ValueError is an empty file
+        return None
+
+    if len(buffer) < HEADER_SIZE:
+        return None
+    magic, node_count, edge_count, names_length, *stamps = CACHE_HEADER.unpack_from(buffer)
+    try:
+        current = (*source_stamp(adjacencies_file), *source_stamp(coordinates_file))
+    except OSError:
+        current = tuple(stamps)  # the text files are gone, the compiled graph is all there is
+    expected_size = HEADER_SIZE + 8 * ((node_count + 1) + 2 * edge_count + 2 * node_count) + names_length
+    if magic != CACHE_MAGIC or tuple(stamps) != current or len(buffer) != expected_size:
+        return None
+
+    view = memoryview(buffer)
+    position = HEADER_SIZE
+
+    def take(count, typecode):
+        nonlocal position
+        values = view[position:position + 8 * count].cast(typecode)
+        position += 8 * count
+        return values
+
+    offsets = take(node_count + 1, 'q')
+    targets = take(edge_count, 'q')
+    weights = take(edge_count, 'd')
+    lat = take(node_count, 'd')
+    lon = take(node_count, 'd')
+    names = bytes(view[position:]).decode("utf-8").split("\n") if node_count else []
+
+    graph = CityGraph(names, offsets, targets, weights, lat, lon)
+    graph.buffer = buffer  # keep the mapping open for as long as the graph is alive
+    return graph
+
+# Loads the road graph from the compiled cache_file, first compiling it from the text files if it is missing or stale
+def load_city_graph(adjacencies_file, coordinates_file, cache_file='graph.bin'):
+    graph = load_graph_cache(cache_file, adjacencies_file, coordinates_file)
+    if graph is None:
+        graph = create_city_graph(adjacencies_file, create_coordinate_dict(coordinates_file))
+        try:
+            save_graph_cache(graph, cache_file, adjacencies_file, coordinates_file)
+        except OSError:
+            pass  # read only directory, just run from the text files
+    return graph
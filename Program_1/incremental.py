@@ -0,0 +1,99 @@
+import heapq
+import math
+
+from shortest_path import BudgetExceeded, SearchResult, path_length
+
+# Lifelong Planning A* (Koenig and Likhachev) for one start -> goal pair on a graph whose roads change.
+# g[node] is the cost the last search settled on and rhs[node] is the one step lookahead min(g[p] + w(p, node)) over
+# the neighbors. A node whose g and rhs disagree is inconsistent and waits in the queue. After a road edit only the
+# two ends of the road are re-checked, so the next plan() repairs the old solution from where the edit made it wrong
+# instead of searching again from scratch. The roads are undirected, so predecessors and successors are the neighbors.
+class LifelongPlanner:
+    def __init__(self, graph, start, goal):
+        self.graph = graph
+        self.start = start
+        self.goal = goal
+        self.version = len(graph.changes)  # road edits already accounted for
+        self.h = graph.heuristic_table(goal)  # straight line km, consistent because set_road never goes below it
+        self.g = [math.inf] * len(graph)
+        self.rhs = [math.inf] * len(graph)
+        self.rhs[start] = 0.0
+        self.queue = [(self.key(start), start)]
+        self.queued = {start: self.queue[0][0]}  # node -> key of its live queue entry, other entries are stale
+        self.nodes_expanded = 0  # over every plan() so far
+
+    def key(self, node):
+        best = min(self.g[node], self.rhs[node])
+        return best + self.h[node], best
+
+    def update_node(self, node):
+        if node != self.start:
+            self.rhs[node] = min((self.g[neighbor] + weight for neighbor, weight in self.graph.edges(node)), default=math.inf)
+        if self.g[node] != self.rhs[node]:
+            key = self.key(node)
+            self.queued[node] = key
+            heapq.heappush(self.queue, (key, node))
+        else:
+            self.queued.pop(node, None)
+
+    # Brings the solution up to date with every road edit since the last plan() and returns it as a SearchResult
+    # (nodes_expanded counts this call only). If a SearchBudget is given and runs out, the result is a BudgetExceeded,
+    # and the planner keeps its progress, so calling plan() again carries on from there.
+    def plan(self, budget=None, stats=None):
+        if budget is not None:
+            budget.start()
+        queue_size = len(self.queue)
+        for a, b, _, _ in self.graph.changes[self.version:]:
+            self.update_node(a)
+            self.update_node(b)
+        self.version = len(self.graph.changes)
+
+        g, rhs, queue, queued = self.g, self.rhs, self.queue, self.queued
+        nodes_expanded = pops = 0
+        while queue and (queue[0][0] < self.key(self.goal) or rhs[self.goal] != g[self.goal]):
+            key, node = heapq.heappop(queue)
+            pops += 1
+            if queued.get(node) != key:  # stale entry left behind by a later update
+                continue
+            del queued[node]
+            if budget is not None and budget.spent(len(queue)):
+                queued[node] = key
+                heapq.heappush(queue, (key, node))  # put it back for the next plan()
+                self.nodes_expanded += nodes_expanded
+                self.count_heap(stats, queue_size, pops - 1)
+                path = self.closest_path()
+                return BudgetExceeded(path, path_length(self.graph, path), budget.expansions, budget.reason)
+            nodes_expanded += 1
+            if stats is not None:
+                stats.expand(len(queued), nodes_expanded, len(self.graph.neighbors(node)))
+
+            if g[node] > rhs[node]:  # overconsistent: the cost went down, settle it
+                g[node] = rhs[node]
+            else:  # underconsistent: the cost went up, so every node that leaned on it has to be re-checked
+                g[node] = math.inf
+                self.update_node(node)
+            for neighbor in self.graph.neighbors(node):
+                self.update_node(neighbor)
+
+        self.nodes_expanded += nodes_expanded
+        self.count_heap(stats, queue_size, pops)
+        if g[self.goal] == math.inf:
+            return SearchResult(None, math.inf, nodes_expanded)
+        return SearchResult(self.path_from(self.goal), g[self.goal], nodes_expanded)
+
+    def count_heap(self, stats, queue_size, pops):  # every entry pushed during plan() was either popped or is still queued
+        if stats is not None:
+            stats.heap_pops += pops
+            stats.heap_pushes += pops + len(self.queue) - queue_size
+
+    # Walks back from node to the start, each step to the neighbor that gives node its cost
+    def path_from(self, node):
+        path = [node]
+        while node != self.start and len(path) <= len(self.graph):
+            node = min(self.graph.edges(node), key=lambda edge: self.g[edge[0]] + edge[1])[0]
+            path.append(node)
+        return path[::-1]
+
+    def closest_path(self):  # partial progress: the path to the settled node closest to the goal
+        settled = [node for node in range(len(self.graph)) if self.g[node] != math.inf]
+        return self.path_from(min(settled, key=self.h.__getitem__)) if settled else [self.start]
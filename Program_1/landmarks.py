@@ -0,0 +1,113 @@
+from array import array
+import math
+import os
+import struct
+
+import numpy as np
+
+from graph import graph_fingerprint
+from shortest_path import single_source
+
+LANDMARK_MAGIC = b'ALT1'
+
+# Distance tables from K landmarks to every node, used for the ALT (A*, Landmarks, Triangle inequality) heuristic.
+# distances[k * N + v] is the road distance in km from landmark k to node v, all stored in one flat array of K * N floats.
+class LandmarkTables:
+    def __init__(self, landmarks, node_count, distances, fingerprint, version=0):
+        self.landmarks = landmarks  # node ids of the landmarks
+        self.node_count = node_count
+        self.distances = distances
+        self.fingerprint = fingerprint  # fingerprint of the graph the tables were built for
+        self.version = version  # how many of the graph's road edits the tables have been checked against
+
+    # Per query heuristic table: heuristic_table(goal)[node] is a lower bound on the road distance from node to goal,
+    # computed for every node at once. The roads are undirected, so by the triangle inequality
+    # d(node, goal) >= |d(L, goal) - d(L, node)| for every landmark L. Nodes no landmark bounds come out as nan.
+    def heuristic_table(self, goal):
+        if not self.landmarks:
+            return np.zeros(self.node_count)
+        table = np.frombuffer(self.distances, dtype=np.float64).reshape(len(self.landmarks), self.node_count)
+        with np.errstate(invalid='ignore'):  # inf - inf where a landmark can't reach either node
+            return np.fmax.reduce(np.abs(table[:, goal:goal + 1] - table), axis=0)
+
+# Farthest-point landmark selection: each new landmark is the node farthest from all the ones already picked,
+# which spreads them around the edge of the map where they give the tightest bounds
+def select_landmarks(graph, k):
+    k = min(k, len(graph))
+    if k == 0:
+        return [], []
+
+    dist, _ = single_source(graph, 0)
+    closest = [math.inf] * len(graph)  # distance from each node to its nearest landmark so far
+    landmarks, rows = [], []
+    candidate = max(range(len(graph)), key=lambda node: dist[node] if dist[node] != math.inf else -1)
+
+    while len(landmarks) < k:
+        landmarks.append(candidate)
+        dist, _ = single_source(graph, candidate)
+        rows.append(dist)
+        for node in range(len(graph)):
+            if dist[node] < closest[node]:
+                closest[node] = dist[node]
+        candidate = max(range(len(graph)), key=closest.__getitem__)  # nodes in a component with no landmark yet come first
+        if closest[candidate] == 0:  # every node is already a landmark
+            break
+
+    return landmarks, rows
+
+# Preprocessing step: picks k landmarks and runs a full Dijkstra from each of them
+def build_landmarks(graph, k=8):
+    landmarks, rows = select_landmarks(graph, k)
+    distances = array('d')
+    for row in rows:
+        distances.extend(row)
+    return LandmarkTables(landmarks, len(graph), distances, graph_fingerprint(graph), len(graph.changes))
+
+# Catches the tables up with the road edits made since they were built. Tables built before roads only got longer or
+# closed still give lower bounds (the old distances are no longer than the new ones, and the triangle inequality held
+# for them), just looser ones, so they are kept. A road that got shorter or opened can make them overestimate, so then
+# they are rebuilt.
+def refresh_landmarks(tables, graph):
+    if any(new < old for _, _, old, new in graph.changes[tables.version:]):
+        return build_landmarks(graph, len(tables.landmarks))
+    tables.version = len(graph.changes)
+    return tables
+
+# File layout: magic, landmark count, node count, graph fingerprint, landmark ids (int32), then the K * N float64 distances
+def save_landmarks(tables, filename):
+    temp_filename = filename + ".tmp"  # write to the side and rename so a reader never sees half a file
+    with open(temp_filename, 'wb') as file:
+        file.write(LANDMARK_MAGIC)
+        file.write(struct.pack('<IIL', len(tables.landmarks), tables.node_count, tables.fingerprint))
+        array('i', tables.landmarks).tofile(file)
+        tables.distances.tofile(file)
+    os.replace(temp_filename, filename)
+
+# Loads tables saved by save_landmarks, returns None if the file is missing, damaged, or was built for a different graph
+def load_landmarks(filename, graph):
+    try:
+        with open(filename, 'rb') as file:
+            if file.read(4) != LANDMARK_MAGIC:
+                return None
+            k, node_count, fingerprint = struct.unpack('<IIL', file.read(struct.calcsize('<IIL')))
+            if node_count != len(graph) or fingerprint != graph_fingerprint(graph):
+                return None
+            landmarks = array('i')
+            landmarks.fromfile(file, k)
+            distances = array('d')
+            distances.fromfile(file, k * node_count)
+    except (OSError, EOFError, struct.error):
+        return None
+
+    return LandmarkTables(list(landmarks), node_count, distances, fingerprint, len(graph.changes))
+
+# Loads the landmark tables for graph from filename, building and saving them first if they are missing or out of date
+def get_landmarks(graph, filename, k=8):
+    tables = load_landmarks(filename, graph)
+    if tables is None:
+        tables = build_landmarks(graph, k)
+        try:
+            save_landmarks(tables, filename)
+        except OSError:
+            pass  # read only directory, just build it again next time
+    return tables
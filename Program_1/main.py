@@ -1,194 +1,308 @@
 from collections import deque
-import create_map
+import argparse
+import difflib
+import os
+from alternatives import k_shortest_paths
+from bidirectional import bidirectional_a_star, bidirectional_bfs
+from contraction import build_hierarchy, get_hierarchy, hierarchy_query, refresh_hierarchy
+from graph_cache import load_city_graph
+from incremental import LifelongPlanner
+from landmarks import get_landmarks, refresh_landmarks
+from memory_bounded import BoundedSearchResult, ida_star
+from search_stats import SearchStats, instrumented
+from budget import SearchBudget
+from shortest_path import BudgetExceeded, SearchResult, partial_path_result, partial_result, path_length, path_to, shortest_path
+from spatial import SpatialIndex
 import heapq
 import math
-import time
+import numpy as np
 from tokenize import Double
 
 algo_timeout_sec = 0.5
+ida_star_growth = 0.05  # IDA* raises its threshold by at least this fraction a pass (0 = exact, but far more passes)
+map_export_dir = None  # set by --export, found routes are saved as images there instead of opening a window
+map_export_format = "png"
 
-# Makes sure the input city is in the database
+# Makes sure the input city is in the database. A "lat, lon" GPS point is snapped to the closest city.
 def get_valid_city(prompt):
     while True:
         city = input(prompt).title()
-        if city in adjacency_dict:
+        if city in city_graph:
             return city
-        else:
-            print(f'\'{city}\' not found in the adjacency dictionary. Please try again.')
-
-# Takes in the adjacencies file and creates a dictionary with the city as the key and the neighbors as the value
-def create_adjacency_dict(filename):
-    adjacency_dict = {}
-    
-    with open(filename, 'r') as file:
-        for line in file:
-            city1, city2 = line.strip().split()
-            
-            if city1 not in adjacency_dict:
-                adjacency_dict[city1] = []
-            adjacency_dict[city1].append(city2)
-            
-            if city2 not in adjacency_dict:
-                adjacency_dict[city2] = []
-            adjacency_dict[city2].append(city1)
-    
-    return adjacency_dict
-
-# Takes in the coordinates of the cities and creates a dictionary with the city as the key and the coordinates as the value
-def create_coordinate_dict(filename):
-    coordinate_dict = {}
-    
-    with open(filename, 'r') as file:
-        for line in file:
-            city, long, lat = line.strip().split(",")
-            coordinate_dict[city] = []
-            coordinate_dict[city].append(float(long))
-            coordinate_dict[city].append(float(lat))
-    
-    return coordinate_dict
+        point = parse_point(city)
+        if point is not None and len(city_index):
+            city = city_graph.names[city_index.snap(*point)]
+            print(f"Snapped to {city}.")
+            return city
+        suggestions = difflib.get_close_matches(city, city_graph.names, n=3)
+        hint = f" Did you mean {', '.join(suggestions)}?" if suggestions else ""
+        print(f'\'{city}\' not found in the road graph.{hint} Please try again.')
+
+def parse_point(text):  # (lat, lon) from "lat, lon", None if the text isn't a point
+    try:
+        lat, lon = (float(part) for part in text.replace(",", " ").split())
+    except ValueError:
+        return None
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+# Translates the path of a SearchResult from ids back to city names
+def named_result(graph, result):
+    if result.path is not None:
+        result.path = graph.to_names(result.path)
+    return result
+
+# SearchResult (in city names) for the searches that don't add up road km as they go: bfs, dfs, iddfs and best first
+# search. path is the list of ids found, or None if there is no path.
+def path_result(graph, budget, path):
+    if path is None:
+        return SearchResult(None, math.inf, budget.expansions)
+    return named_result(graph, SearchResult(path, path_length(graph, path), budget.expansions))
+
+# Every search takes an optional SearchBudget, when none is given it gets algo_timeout_sec of wall clock time.
+# A search that runs out returns a BudgetExceeded with the best partial path instead of a path.
+# Every search also takes an optional stats=SearchStats() that it fills in (see search_stats.py).
+def default_budget(budget):
+    return budget if budget is not None else SearchBudget(timeout_sec=algo_timeout_sec)
 
 # Breadth First Search
-def bfs(graph, start, goal):
-    start_time = time.time()
-
-    while start_time + algo_timeout_sec > time.time():  # Timeout
+@instrumented("bfs")
+def bfs(graph, start, goal, budget=None, stats=None):
+    budget = default_budget(budget)
+    budget.start()
+    start, goal = graph.ids[start], graph.ids[goal]  # search on the int ids of the cities
+
+    queue = deque([start])  # Makes a deq that stores the nodes
+    came_from = [-1] * len(graph)  # the node each node was reached from
+    visited = bytearray(len(graph))
+    visited[start] = 1
+    
+    while queue:  # While items in the queue
+        city = queue.popleft()  # Pop the first item in the queue
+        
+        if city == goal:  # If found goal, then return
+            return path_result(graph, budget, path_to(came_from, city))
 
-        queue = deque([[start]])  # Makes a deq that stores the nodes
-        visited = set([start])
+        if budget.spent(len(queue)):  # out of time, expansions, or queue space
+            return named_result(graph, partial_result(graph, budget, came_from, visited, goal))
+        if stats is not None:  # everything visited has either been popped or is still in the queue
+            stats.expand(len(queue), stats.nodes_expanded + 1 + len(queue), len(graph.neighbors(city)))
         
-        while queue:  # While items in the queue
-            path = queue.popleft()  # Pop the first item in the queue
-            city = path[-1]  # Set city to the last element in the list
-            
-            if city == goal:  # If found goal, then return
-                return path
-            
-            for neighbor in graph.get(city, []):
-                if neighbor not in visited:  # If the neighbor is not visited, add it to the visited set
-                    visited.add(neighbor)
-                    new_path = list(path)  # add to our new path
-                    new_path.append(neighbor)
-                    queue.append(new_path)  # add new path to the queue
-
-        return None  # If no path is found
+        for neighbor in graph.neighbors(city):
+            if not visited[neighbor]:  # If the neighbor is not visited, add it to the visited set
+                visited[neighbor] = 1
+                came_from[neighbor] = city
+                queue.append(neighbor)  # add the neighbor to the queue
+
+    return path_result(graph, budget, None)  # If no path is found
 
 # depth-first search
-def dfs(graph, start, goal, path=None, visited=None):
-    start_time = time.time()
-
-    while start_time + algo_timeout_sec > time.time():  # Timeout
-        if visited is None: # Initializing variables
-            visited = set()
-        if path is None:
-            path = []
-        
-        path = path + [start]  # updating the path
-        visited.add(start)  # marking the start as visited
-        
-        if start == goal:  # if were at the goal, return
-            return path
-        
-        for neighbor in graph.get(start, []):
-            if neighbor not in visited:  # If a neighbor is not visited, recursively call dfs with new "start"
-                result = dfs(graph, neighbor, goal, path, visited)
-                if result is not None:  # found a path
-                    return result
-        
-        return None  # If no path is found
+# Uses an explicit stack of (node, neighbor iterator) instead of recursion, so long chains can't hit the recursion
+# limit, and parent pointers instead of copying the path at every level. Visits the cities in the same order.
+@instrumented("dfs")
+def dfs(graph, start, goal, budget=None, stats=None):
+    budget = default_budget(budget)
+    budget.start()
+    start, goal = graph.ids[start], graph.ids[goal]
+    if start == goal:  # if were at the goal, return
+        return path_result(graph, budget, [start])
+
+    came_from = [-1] * len(graph)
+    visited = bytearray(len(graph))
+    visited[start] = 1  # marking the start as visited
+    stack = [(start, iter(graph.neighbors(start)))]
+
+    while stack:
+        city, neighbors = stack[-1]
+        neighbor = next((n for n in neighbors if not visited[n]), -1)  # picks up where this city left off
+        if neighbor == -1:  # every neighbor is visited, back up
+            stack.pop()
+            continue
+
+        visited[neighbor] = 1
+        came_from[neighbor] = city
+        if neighbor == goal:  # found a path
+            return path_result(graph, budget, path_to(came_from, neighbor))
+        if budget.spent(len(stack)):  # the stack is the frontier
+            return named_result(graph, partial_result(graph, budget, came_from, visited, goal))
+        stack.append((neighbor, iter(graph.neighbors(neighbor))))  # go down into the neighbor
+        if stats is not None:  # visited is the start plus every node pushed so far
+            stats.expand(len(stack), stats.nodes_expanded + 2, len(graph.neighbors(neighbor)))
+
+    return path_result(graph, budget, None)  # If no path is found
 
 # ID-Depth First Search
-def dfs_with_depth_limit(graph, start, goal, depth_limit, path=None):
-    if path is None:  # initializing variable
-        path = []
-    
-    path = path + [start]  # updating the path
-    
+# One depth limited pass with an explicit stack. on_path is a flag per node (all zero on entry and on return) so the
+# "not already on this path" check is O(1). reached holds the last pass each node was reached in, and this pass marks
+# the nodes it reaches with stamp. Returns (result, count): result is the path of ids, None, or a BudgetExceeded, and
+# count is how many different nodes this pass reached.
+def dfs_with_depth_limit(graph, start, goal, depth_limit, budget, on_path, reached, stamp, stats=None):
     if start == goal:  # if we foudn the goal, return
-        return path
-    
-    if depth_limit == 0:  # if we cant go any deeper, return
-        return None
-    
-    for neighbor in graph.get(start, []):
-        if neighbor not in path:  # if the neighbor is not in the path, recursively call iddfs with a new start, and depth_limit
-            result = dfs_with_depth_limit(graph, neighbor, goal, depth_limit - 1, path)
-            if result is not None:  # if we found a path
-                return result
-    
-    return None  # if no path is found
-
-def iddfs(graph, start, goal, max_depth):
-    start_time = time.time()
-
-    while start_time + algo_timeout_sec > time.time(): # timeout
-        for depth in range(max_depth):  # will call dfs each time with increasing depth
-            result = dfs_with_depth_limit(graph, start, goal, depth)
-            if result is not None:
-                return result
-        return None  # if no path is found
+        return [start], 1
+
+    on_path[start] = 1
+    reached[start] = stamp
+    count = 1
+    stack = [(start, iter(graph.neighbors(start)))]
+
+    while stack:
+        city, neighbors = stack[-1]
+        if len(stack) > depth_limit:  # if we cant go any deeper, back up
+            on_path[city] = 0
+            stack.pop()
+            continue
+
+        neighbor = next((n for n in neighbors if not on_path[n]), -1)  # next neighbor that is not already in the path
+        if neighbor == -1:
+            on_path[city] = 0
+            stack.pop()
+            continue
+
+        if neighbor == goal or budget.spent(len(stack)):
+            path = [node for node, _ in stack] + [neighbor]
+            for node in path:  # leave on_path clean for the next pass
+                on_path[node] = 0
+            if neighbor == goal:  # if we found a path
+                return path, count
+            return partial_path_result(graph, budget, path), count
+
+        on_path[neighbor] = 1
+        if reached[neighbor] != stamp:  # first time this pass
+            reached[neighbor] = stamp
+            count += 1
+        stack.append((neighbor, iter(graph.neighbors(neighbor))))  # one level deeper
+        if stats is not None:  # only the current path is kept
+            stats.expand(len(stack), len(stack), len(graph.neighbors(neighbor)))
+
+    return None, count  # if no path is found
+
+@instrumented("iddfs")
+def iddfs(graph, start, goal, max_depth, budget=None, stats=None):
+    budget = default_budget(budget)
+    budget.start()  # one budget for all the depths
+    start, goal = graph.ids[start], graph.ids[goal]
+    on_path = bytearray(len(graph))  # shared by every pass
+    reached = [-1] * len(graph)  # stamped with the depth of the last pass that reached each node
+    previous = 0  # nodes reached by the last pass
+
+    for depth in range(max_depth):  # will call dfs each time with increasing depth
+        result, count = dfs_with_depth_limit(graph, start, goal, depth, budget, on_path, reached, depth, stats)
+        if isinstance(result, BudgetExceeded):
+            return named_result(graph, result)
+        if result is not None:
+            return path_result(graph, budget, result)
+        if count == previous:  # this pass reached no new nodes, so everything reachable has been seen
+            break
+        previous = count
+    return path_result(graph, budget, None)  # if no path is found
 
 # Best first search
 # gotten from claude with the prompt "Give me the best first search algorithm in python"
-def best_first_search(graph, start, goal, calculate_distance):
-    start_time = time.time()
-
-    while start_time + algo_timeout_sec > time.time():  # timeout
-        frontier = [(calculate_distance(start, goal), start)] # used as the heuristic and gets the distance between the start and goal city
-        came_from = {start: None} # initializes the node you came from and initializes it to None
-        
-        while frontier:  # While items in the frontier to be searched
-            _, current = heapq.heappop(frontier) # pops the node with the lowest heuristic value and ignores the actual value
-            
-            if current == goal:  # if we found the goal city, go through the came from variable and reconstruct the path
-                path = []
-                while current:
-                    path.append(current)
-                    current = came_from[current]
-                return path[::-1]
-            
-            for neighbor in graph.get(current, []): # goes through all neighbors of the current node
-                if neighbor not in came_from:  # if a neighbor has not been visited, add it to the came_from dictionary
-                    came_from[neighbor] = current
-                    heapq.heappush(frontier, (calculate_distance(neighbor, goal), neighbor))  # adds the neighbor to the frontier with the distance as its priority
+@instrumented("best first search")
+def best_first_search(graph, start, goal, budget=None, stats=None):
+    budget = default_budget(budget)
+    budget.start()
+    start, goal = graph.ids[start], graph.ids[goal]
+
+    distance_to_goal = graph.heuristic_table(goal)  # straight line distance from every city to the goal, computed once
+    frontier = [(distance_to_goal[start], start)] # used as the heuristic and gets the distance between the start and goal city
+    came_from = [-1] * len(graph) # the node you came from, -1 for the start and for nodes not seen yet
+    seen = bytearray(len(graph))
+    seen[start] = 1
+    if stats is not None:
+        stats.heap_pushes += 1
+    
+    while frontier:  # While items in the frontier to be searched
+        _, current = heapq.heappop(frontier) # pops the node with the lowest heuristic value and ignores the actual value
+        if stats is not None:
+            stats.heap_pops += 1
         
-        return None  # No path found
-
-# gotten from claude with the prompt "Give me the A* algorithm in python"
-def a_star_search(graph, start, goal, calculate_distance):
-    start_time = time.time()
+        if current == goal:  # if we found the goal city, go through the came from variable and reconstruct the path
+            return path_result(graph, budget, path_to(came_from, current))
 
-    while start_time + algo_timeout_sec > time.time():  # timeout
-        frontier = [(0, start)] # starts the frontier priority queue with the start node at 0
-        came_from = {start: None}  # initializes the came_from dict
-        cost_so_far = {start: 0}  # initializes the cost_so_far dict
+        if budget.spent(len(frontier)):
+            return named_result(graph, partial_result(graph, budget, came_from, seen, goal))
+        if stats is not None:  # every node seen has either been popped or is still in the frontier
+            stats.expand(len(frontier), stats.heap_pops + len(frontier), len(graph.neighbors(current)))
         
-        while frontier:  # while the frontier has nodes to explore, pop the node with the lowest cost
-            current_cost, current = heapq.heappop(frontier)
-            
-            if current == goal:  # if the goal is reached, reconstruct the path using the came from dict and return it
-                path = []
-                while current:
-                    path.append(current)
-                    current = came_from[current]
-                return path[::-1]
-            
-            for neighbor in graph.get(current, []):  # goes through all neighbors of the current node
-                new_cost = cost_so_far[current] + 1  # updates the cost
-                if neighbor not in cost_so_far or new_cost < cost_so_far[neighbor]:  # checks if neighbor has been visited or if the new cost is lower
-                    cost_so_far[neighbor] = new_cost  # if a better path is found, update the cost
-                    priority = new_cost + calculate_distance(neighbor, goal)  # calculates the cost to get to the neighbor
-                    heapq.heappush(frontier, (priority, neighbor))  # adds the neighbor to the frontier with the priority
-                    came_from[neighbor] = current  # keeps track of the node you came from
-        
-        return None  # No path found
+        for neighbor in graph.neighbors(current): # goes through all neighbors of the current node
+            if not seen[neighbor]:  # if a neighbor has not been visited, remember where it came from
+                seen[neighbor] = 1
+                came_from[neighbor] = current
+                heapq.heappush(frontier, (distance_to_goal[neighbor], neighbor))  # adds the neighbor to the frontier with the distance as its priority
+                if stats is not None:
+                    stats.heap_pushes += 1
+    
+    return path_result(graph, budget, None)  # No path found
+
+# The A* heuristic for every node at once: haversine to the target, or the larger of haversine and the ALT bound
+def heuristic_table(graph, target, landmarks=None):
+    if landmarks is None:
+        return graph.heuristic_table(target)
+    return np.fmax(graph.distances_to(target), landmarks.heuristic_table(target)).tolist()
+
+# A* over the haversine road lengths with the straight line distance to the goal as the heuristic.
+# If landmark tables are given, the heuristic is the larger of haversine and the ALT bound, which is much tighter on winding roads.
+# Returns the SearchResult with the path translated back to city names.
+@instrumented("a*")
+def a_star_search(graph, start, goal, landmarks=None, budget=None, stats=None):
+    start, goal = graph.ids[start], graph.ids[goal]
+    heuristic = heuristic_table(graph, goal, landmarks).__getitem__
+    return named_result(graph, shortest_path(graph, start, goal, heuristic, default_budget(budget), stats))
+
+# Dijkstra, the same search as A* without a heuristic, so you can compare how many nodes the heuristic saves
+@instrumented("dijkstra")
+def dijkstra_search(graph, start, goal, budget=None, stats=None):
+    return named_result(graph, shortest_path(graph, graph.ids[start], graph.ids[goal], None, default_budget(budget), stats))
+
+# Bidirectional BFS, searches from both cities at once and meets in the middle (fewest hops, like bfs)
+@instrumented("bidirectional bfs")
+def bidirectional_bfs_search(graph, start, goal, budget=None, stats=None):
+    return named_result(graph, bidirectional_bfs(graph, graph.ids[start], graph.ids[goal], default_budget(budget), stats))
+
+# Bidirectional A*, the forward search aims at the goal and the backward search aims at the start
+@instrumented("bidirectional a*")
+def bidirectional_a_star_search(graph, start, goal, landmarks=None, budget=None, stats=None):
+    start, goal = graph.ids[start], graph.ids[goal]
+    to_goal = heuristic_table(graph, goal, landmarks).__getitem__
+    to_start = heuristic_table(graph, start, landmarks).__getitem__
+    return named_result(graph, bidirectional_a_star(graph, start, goal, to_goal, to_start, default_budget(budget), stats))
+
+# IDA*, the memory bounded mode for graphs too big for A*'s open and closed sets. max_nodes caps how deep its stack
+# can get and the result reports the peak memory it used. growth defaults to ida_star_growth: on real valued road
+# lengths each exact threshold bump only lets about one more node in, so growth = 0 rarely finishes in time on a big graph.
+@instrumented("ida*")
+def ida_star_search(graph, start, goal, max_nodes=None, growth=None, budget=None, stats=None):
+    growth = growth if growth is not None else ida_star_growth
+    return named_result(graph, ida_star(graph, graph.ids[start], graph.ids[goal], max_nodes, growth, default_budget(budget), stats))
+
+# Lifelong Planning A*: the first plan is an ordinary A* search, and after road edits (city_graph.set_road and
+# remove_road) passing the same planner again repairs the old route instead of searching from scratch
+@instrumented("lpa*")
+def lpa_star_search(graph, start, goal, planner=None, budget=None, stats=None):
+    planner = planner if planner is not None else LifelongPlanner(graph, graph.ids[start], graph.ids[goal])
+    return named_result(graph, planner.plan(default_budget(budget), stats))
+
+# Up to k loopless alternative routes from start to goal, shortest first, as SearchResults with city names
+# (Yen's algorithm, see alternatives.py), or a BudgetExceeded if the budget ran out first
+@instrumented("k shortest")
+def k_shortest_search(graph, start, goal, k=3, budget=None, stats=None):
+    routes = k_shortest_paths(graph, graph.ids[start], graph.ids[goal], k, default_budget(budget), stats)
+    if isinstance(routes, BudgetExceeded):
+        return named_result(graph, routes)
+    return [named_result(graph, route) for route in routes]
+
+# Contraction hierarchy query, the hierarchy is built offline (or on first use) and saved next to the data files
+@instrumented("ch")
+def contraction_hierarchy_search(graph, start, goal, hierarchy, stats=None):
+    return named_result(graph, hierarchy_query(hierarchy, graph.ids[start], graph.ids[goal], stats))
 
 # calculate_distance for finding the distance between two cities
 def calculate_distance(city, goal):
     R = 6371 # radius of earth in km
 
     # Gets the coordinates
-    lat1, lon1 = coordinate_dict[city]
-    lat2, lon2 = coordinate_dict[goal]
+    lat1, lon1 = city_graph.coordinates(city)
+    lat2, lon2 = city_graph.coordinates(goal)
 
     # Convert degrees to radians because haversine expects radians
     lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
@@ -206,15 +320,11 @@ def calculate_route_distance(cities):
     if len(cities) < 2:
         return "At least two cities are required to calculate a route."
 
-    total_distance = 0  # initializes to 0
-    for i in range(len(cities) - 1):  # as long as there is a city
-        city1, city2 = cities[i], cities[i+1]  # makes the city and its neighbor into variables
-        
-        if city1 not in coordinate_dict or city2 not in coordinate_dict:  # checks if the cities are in the database
-            return f"Coordinates not found for {city1 if city1 not in coordinate_dict else city2}"
+    for city in cities:  # checks if the cities are in the database
+        if city not in city_graph:
+            return f"Coordinates not found for {city}"
 
-        distance = calculate_distance(city1, city2)  # calculates the distance between the two cities
-        total_distance += distance  # adds it to the total distance
+    total_distance = city_graph.route_distance([city_graph.ids[city] for city in cities])  # every leg at once
 
     # Round to the nearest 10
     return round(total_distance, 1)
@@ -223,8 +333,8 @@ def calculate_route_distance(cities):
 def get_cities(path):
     new_dict = {}
     for city in path:  # for each city in the path, get the city, and add it to the new_dict
-        if city in coordinate_dict.keys():
-            new_dict[city] = (coordinate_dict[city][0], coordinate_dict[city][1])
+        if city in city_graph:
+            new_dict[city] = city_graph.coordinates(city)
     return new_dict  # send the new_dict to the gui to plot the points
 
 
@@ -237,14 +347,62 @@ COLOR = {
     "ENDC": "\033[0m",
 }
 
+# Opens the map window for a found path, or in headless mode (map_export_dir set) saves it as an image instead.
+# create_map is only imported here, so runs that never draw don't load tkinter or matplotlib's GUI backend.
+def show_route(path, search_algo):
+    import create_map
+    if map_export_dir is None:
+        create_map.main(get_cities(path))  # launch the gui displaying the path
+        return
+    algo_name = search_algo.replace("*", "_star").replace(" ", "_")
+    filename = os.path.join(map_export_dir, f"{path[0]}_to_{path[-1]}_{algo_name}.{map_export_format}")
+    create_map.export_map(get_cities(path), filename, route=path, title=f"{path[0]} to {path[-1]} using {search_algo}")
+    print(f"Saved the map to {filename}")
+
+# Prints the outcome of one search, returns True if there is a path to show on the map
+def print_result(start_city, goal_city, search_algo, path, result, stats):
+    if isinstance(result, BudgetExceeded):  # ran out of budget, show how far it got
+        print(f"Search stopped by the {COLOR["RED"]}{result.reason}{COLOR["ENDC"]} budget after {result.nodes_expanded} expansions.")
+        print("Closest it got:", " -> ".join(result.path))
+    elif path: # if theres a path, print it to console with colors so the important info is easier to see
+        print(COLOR["BLUE"], end="")
+        print(f"\nPath from {start_city} to {goal_city} using {COLOR["RED"]}{search_algo}{COLOR["ENDC"]}:")
+        print(" -> ".join(path), f"takes a total of {COLOR["BLUE"]}{calculate_route_distance(path)}{COLOR["ENDC"]} km")
+        print(COLOR["ENDC"], end="")
+        print(f"Time taken: {COLOR["GREEN"]}{stats.elapsed_ns / 1_000:.2f}{COLOR["ENDC"]} microseconds")
+        print(f"Nodes expanded: {COLOR["GREEN"]}{stats.nodes_expanded}{COLOR["ENDC"]}, edges relaxed: {COLOR["GREEN"]}{stats.edges_relaxed}{COLOR["ENDC"]}, "
+              f"heap pushes/pops: {COLOR["GREEN"]}{stats.heap_pushes}/{stats.heap_pops}{COLOR["ENDC"]}")
+        print(f"Peak frontier: {COLOR["GREEN"]}{stats.peak_frontier}{COLOR["ENDC"]}, peak visited: {COLOR["GREEN"]}{stats.peak_visited}{COLOR["ENDC"]}")
+        if isinstance(result, BoundedSearchResult):
+            print(f"Peak memory: {COLOR["GREEN"]}{result.peak_nodes}{COLOR["ENDC"]} nodes (about {result.peak_bytes} bytes)")
+        return True
+    else:
+        print(f"No path found from {COLOR["BLUE"]}{start_city}{COLOR["ENDC"]} to {COLOR["BLUE"]}{goal_city}{COLOR["ENDC"]} using {COLOR['RED']}{search_algo}{COLOR['ENDC']}.")
+    return False
+
 if __name__ == "__main__":
-    # Create the adjacency dictionary
+    # python main.py [--export DIR] [--format png|svg]
+    parser = argparse.ArgumentParser(description="Find routes between Kansas cities")
+    parser.add_argument("--export", metavar="DIR", help="save route maps as images in DIR instead of opening a window (no display needed)")
+    parser.add_argument("--format", choices=["png", "svg"], default="png", help="image format for --export")
+    args = parser.parse_args()
+    if args.export:
+        os.makedirs(args.export, exist_ok=True)
+        map_export_dir, map_export_format = args.export, args.format
+
+    # Load the road graph with the city names interned to ints. The compiled graph.bin is memory mapped,
+    # and it is only rebuilt from the text files when adjacencies.txt or coordinates.csv change.
     adjacencies_txt = 'adjacencies.txt'
-    adjacency_dict = create_adjacency_dict(adjacencies_txt)
-
-    # Get the distances between cities
     coordinates_csv = 'coordinates.csv'
-    coordinate_dict = create_coordinate_dict(coordinates_csv)
+    graph_bin = 'graph.bin'
+    city_graph = load_city_graph(adjacencies_txt, coordinates_csv, graph_bin)
+    city_index = SpatialIndex(city_graph)  # nearest city lookups for GPS points
+
+    # Landmark distance tables for the A* heuristic, only rebuilt when the graph changes
+    landmarks_bin = 'landmarks.bin'
+    landmarks = get_landmarks(city_graph, landmarks_bin)
+    hierarchy_bin = 'hierarchy.bin'
+    hierarchy = None  # loaded the first time it is used
 
     again = "y"
 
@@ -253,40 +411,80 @@ if __name__ == "__main__":
         # Get valid inputs for the start and goal cities
         start_city = get_valid_city("Enter the starting city: ")
         goal_city = get_valid_city("Enter the city to go to: ")
-        selected_algo = input("Enter the search algorithm (bfs, dfs, iddfs, best first search, A*): ").strip().lower()
+        selected_algo = input("Enter the search algorithm (bfs, bidirectional bfs, dfs, iddfs, best first search, A*, bidirectional A*, IDA*, dijkstra, ch, LPA*, k shortest): ").strip().lower()
         search_algo = selected_algo
+        path, result = None, None
+        stats = SearchStats()  # counters and perf_counter_ns timing filled in by the search
 
         match search_algo:
             case "bfs":
-                start_time = time.time()
-                path = bfs(adjacency_dict, start_city, goal_city)
-                end_time = time.time()
+                result = bfs(city_graph, start_city, goal_city, stats=stats)
             case "dfs":
-                start_time = time.time()
-                path = dfs(adjacency_dict, start_city, goal_city)
-                end_time = time.time()
+                result = dfs(city_graph, start_city, goal_city, stats=stats)
             case "iddfs":
                 max_depth = int(input("Enter the maximum depth: "))
-                start_time = time.time()
-                path = iddfs(adjacency_dict, start_city, goal_city, max_depth)
-                end_time = time.time()
+                result = iddfs(city_graph, start_city, goal_city, max_depth, stats=stats)
             case "best first search":
-                start_time = time.time()
-                path = best_first_search(adjacency_dict, start_city, goal_city, calculate_distance)
-                end_time = time.time()
+                result = best_first_search(city_graph, start_city, goal_city, stats=stats)
             case "a*":
-                start_time = time.time()
-                path = a_star_search(adjacency_dict, start_city, goal_city, calculate_distance)
-                end_time = time.time()
-            
-        if path: # if theres a path, print it to console with colors so the important info is easier to see
-            print(COLOR["BLUE"], end="")
-            print(f"\nPath from {start_city} to {goal_city} using {COLOR["RED"]}{search_algo}{COLOR["ENDC"]}:")
-            print(" -> ".join(path), f"takes a total of {COLOR["BLUE"]}{calculate_route_distance(path)}{COLOR["ENDC"]} km")
-            print(COLOR["ENDC"], end="")
-            print(f"Time taken: {COLOR["GREEN"]}{(end_time - start_time) * 1_000_000:.2f}{COLOR["ENDC"]} microseconds")
-            create_map.main(get_cities(path))  # launch the gui displaying the path
-        else:
-            print(f"No path found from {COLOR["BLUE"]}{start_city}{COLOR["ENDC"]} to {COLOR["BLUE"]}{goal_city}{COLOR["ENDC"]} using {COLOR['RED']}{search_algo}{COLOR['ENDC']}.")
+                result = a_star_search(city_graph, start_city, goal_city, landmarks, stats=stats)
+            case "bidirectional bfs":
+                result = bidirectional_bfs_search(city_graph, start_city, goal_city, stats=stats)
+            case "bidirectional a*":
+                result = bidirectional_a_star_search(city_graph, start_city, goal_city, landmarks, stats=stats)
+            case "ch":
+                if hierarchy is None:  # after road edits the saved one is for the wrong roads, so it is built in memory
+                    hierarchy = get_hierarchy(city_graph, hierarchy_bin) if not city_graph.changes else build_hierarchy(city_graph)
+                hierarchy = refresh_hierarchy(hierarchy, city_graph)
+                result = contraction_hierarchy_search(city_graph, start_city, goal_city, hierarchy, stats=stats)
+            case "ida*":
+                ceiling = input("Enter the memory ceiling, the most nodes on the stack (press enter for no limit): ").strip()
+                growth = input(f"Enter how much the threshold grows each pass, 0 for the exact shortest route (press enter for {ida_star_growth}): ").strip()
+                result = ida_star_search(city_graph, start_city, goal_city, int(ceiling) if ceiling else None,
+                                         float(growth) if growth else None, stats=stats)
+            case "dijkstra":
+                result = dijkstra_search(city_graph, start_city, goal_city, stats=stats)
+            case "k shortest":
+                k = int(input("How many routes? "))
+                routes = k_shortest_search(city_graph, start_city, goal_city, k, stats=stats)
+                if isinstance(routes, BudgetExceeded):
+                    result = routes
+                else:
+                    for rank, route in enumerate(routes, 1):
+                        print(f"Route {rank}: {' -> '.join(route.path)} ({COLOR['BLUE']}{calculate_route_distance(route.path)}{COLOR['ENDC']} km)")
+                    result = routes[0] if routes else None
+            case "lpa*":
+                planner = LifelongPlanner(city_graph, city_graph.ids[start_city], city_graph.ids[goal_city])
+                result = lpa_star_search(city_graph, start_city, goal_city, planner, stats=stats)
+        if result is not None and not isinstance(result, BudgetExceeded):
+            path = result.path
+
+        if print_result(start_city, goal_city, search_algo, path, result, stats):
+            show_route(path, search_algo)
+
+        # Incremental planner mode: close and reopen roads on the live graph and let LPA* repair the route
+        while search_algo == "lpa*":
+            road = input("Close or reopen a road (city1 city2), or press enter to stop: ").title().split()
+            if not road:
+                break
+            if len(road) != 2 or any(city not in city_graph for city in road) or road[0] == road[1]:
+                print("Enter two different cities from the road graph.")
+                continue
+            a, b = city_graph.ids[road[0]], city_graph.ids[road[1]]
+            try:
+                if city_graph.find_edge(a, b) != -1:
+                    city_graph.remove_road(a, b)
+                    print(f"Closed the road from {road[0]} to {road[1]}.")
+                else:
+                    city_graph.set_road(a, b)
+                    print(f"Opened a road from {road[0]} to {road[1]}.")
+            except (KeyError, ValueError) as error:
+                print(f"Can't change that road: {error.args[0] if error.args else error}")
+                continue
+            landmarks = refresh_landmarks(landmarks, city_graph)
+            stats = SearchStats()
+            result = lpa_star_search(city_graph, start_city, goal_city, planner, stats=stats)
+            path = result.path
+            print_result(start_city, goal_city, search_algo, path, result, stats)
 
         again = input("Would you like to try again? (y/n): ").strip().lower()
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+import math
+import sys
+
+from shortest_path import SearchResult, partial_path_result
+
+@dataclass  # SearchResult plus how much memory the search held at its peak
+class BoundedSearchResult(SearchResult):
+    peak_nodes: int = 0  # most nodes on the search stack at once
+    peak_bytes: int = 0  # estimate of what those stack entries took
+
+# Approximate size of one stack entry (node id, cost, edge iterator, and its slot in the on-path set)
+def stack_entry_bytes(graph):
+    edges = graph.edges(0) if len(graph) else iter(())
+    entry = (0, 0.0, edges)
+    return sys.getsizeof(entry) + sys.getsizeof(0) + sys.getsizeof(0.0) + sys.getsizeof(edges) + 2 * sys.getsizeof(0)
+
+# IDA*: depth first passes that only go down paths with g + h <= threshold, raising the threshold to the smallest
+# f that went over it after every pass. Only the current path is ever kept, so the search memory is O(path length) no
+# matter how big the graph is, at the price of re-expanding nodes on every pass. The one O(N) part is the per-goal
+# heuristic table (a float per node, next to the graph's own per-node arrays), which saves a haversine per neighbor.
+# max_nodes is the memory ceiling, the deepest the stack may get (paths longer than that are never tried).
+# growth > 0 raises the threshold by at least that fraction each pass, which cuts the number of passes on real
+# valued road lengths and keeps the route within a factor of (1 + growth) of the shortest.
+# If a SearchBudget is given and runs out, the result is a BudgetExceeded. If a SearchStats is given it is filled in.
+def ida_star(graph, start, goal, max_nodes=None, growth=0.0, budget=None, stats=None):
+    if budget is not None:
+        budget.start()
+    entry_bytes = stack_entry_bytes(graph)
+    heuristic = graph.heuristic_table(goal)
+    max_nodes = max_nodes if max_nodes is not None else math.inf
+    threshold = heuristic[start]
+    nodes_expanded = 0
+    peak_nodes = 1
+
+    while True:
+        stack = [(start, 0.0, graph.edges(start))]
+        on_path = {start}
+        next_threshold = math.inf
+        if start == goal:
+            return BoundedSearchResult([start], 0.0, 0, 1, entry_bytes)
+
+        while stack:
+            node, cost, edges = stack[-1]
+            for neighbor, weight in edges:  # picks up where this node left off
+                if neighbor in on_path:
+                    continue
+                new_cost = cost + weight
+                f = new_cost + heuristic[neighbor]
+                if f > threshold:  # over the line this pass, remember by how little for the next one
+                    next_threshold = min(next_threshold, f)
+                    continue
+                if neighbor == goal:  # the path is only read off the stack here and when the budget stops the search
+                    path = [entry[0] for entry in stack] + [neighbor]
+                    return BoundedSearchResult(path, new_cost, nodes_expanded, peak_nodes, peak_nodes * entry_bytes)
+                if len(stack) >= max_nodes:  # at the memory ceiling, can't go deeper
+                    continue
+                nodes_expanded += 1
+                if budget is not None and budget.spent(len(stack)):
+                    return partial_path_result(graph, budget, [entry[0] for entry in stack] + [neighbor])
+                stack.append((neighbor, new_cost, graph.edges(neighbor)))
+                on_path.add(neighbor)
+                if stats is not None:  # the stack is both the frontier and everything visited
+                    stats.expand(len(stack), len(on_path), graph.offsets[neighbor + 1] - graph.offsets[neighbor])
+                peak_nodes = max(peak_nodes, len(stack))
+                break
+            else:  # every neighbor is done, back up
+                on_path.discard(node)
+                stack.pop()
+
+        if next_threshold == math.inf:  # nothing was cut off by the threshold, so the goal can't be reached (within max_nodes)
+            return BoundedSearchResult(None, math.inf, nodes_expanded, peak_nodes, peak_nodes * entry_bytes)
+        threshold = max(next_threshold, threshold * (1 + growth))
@@ -0,0 +1,64 @@
+from dataclasses import asdict, dataclass
+import functools
+import json
+import time
+
+@dataclass  # Counters a search fills in when it is given a SearchStats (or when a stats hook is registered)
+class SearchStats:
+    algorithm: str = ""
+    nodes_expanded: int = 0
+    edges_relaxed: int = 0
+    heap_pushes: int = 0
+    heap_pops: int = 0
+    peak_frontier: int = 0
+    peak_visited: int = 0
+    elapsed_ns: int = 0  # from time.perf_counter_ns, monotonic and high resolution
+
+    # Called once per expansion with the current frontier and visited sizes and the expanded node's edge count
+    def expand(self, frontier_size, visited_size, edges):
+        self.nodes_expanded += 1
+        self.edges_relaxed += edges
+        if frontier_size > self.peak_frontier:
+            self.peak_frontier = frontier_size
+        if visited_size > self.peak_visited:
+            self.peak_visited = visited_size
+
+# Sinks that get every finished SearchStats, e.g. to stream them to a log or a metrics system.
+# While this list is empty and no stats object is passed in, the searches skip all of the counting.
+stats_hooks = []
+
+def add_stats_hook(hook):
+    stats_hooks.append(hook)
+
+def remove_stats_hook(hook):
+    stats_hooks.remove(hook)
+
+# A stats hook that writes each SearchStats as one JSON line to an open file
+class JsonLinesSink:
+    def __init__(self, file):
+        self.file = file
+
+    def __call__(self, stats):
+        self.file.write(json.dumps(asdict(stats)) + "\n")
+        self.file.flush()
+
+# Decorator for the search functions: if a stats=SearchStats() keyword is passed, or any hook is registered, the
+# search is timed with perf_counter_ns, its counters are filled in, and the stats are sent to every hook.
+# Otherwise the search runs with stats=None and its counting is skipped.
+def instrumented(algorithm):
+    def wrap(search):
+        @functools.wraps(search)
+        def run(*args, stats=None, **kwargs):
+            if stats is None and not stats_hooks:
+                return search(*args, **kwargs)
+
+            stats = stats if stats is not None else SearchStats()
+            stats.algorithm = algorithm
+            start = time.perf_counter_ns()
+            result = search(*args, stats=stats, **kwargs)
+            stats.elapsed_ns = time.perf_counter_ns() - start
+            for hook in stats_hooks:
+                hook(stats)
+            return result
+        return run
+    return wrap
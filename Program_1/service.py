@@ -0,0 +1,180 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+from alternatives import AlternativeRoutes
+import batch
+import main
+from graph_cache import load_city_graph
+from landmarks import get_landmarks
+from search_stats import SearchStats
+from shortest_path import BudgetExceeded
+from spatial import SpatialIndex, snap_to_city
+
+# Route service: loads the graph once and answers route queries sent as JSON lines, one object per line, on stdin or
+# on a local TCP or Unix socket. A query looks like
+#     {"id": 1, "start": "Anthony", "goal": [39.05, -95.68], "algorithm": "a*"}
+# where start and goal are city names or [lat, lon] GPS points (snapped to the closest city) and algorithm is any of
+# the menu's (a* by default). An optional "max_depth" is the iddfs depth limit and the IDA* memory ceiling, and an
+# optional "k" is how many routes "k shortest" looks for (3 by default): the shortest is the answer's path and the
+# others come back in "alternatives", as {"path": [...], "distance_km": 130.2} objects.
+# Each answer is one JSON line with the same id:
+#     {"id": 1, "status": "ok", "path": [...], "distance_km": 123.4, "nodes_expanded": 17, "search_ms": 0.21, "total_ms": 0.35}
+# status is "ok", "no_path", "budget_exceeded" (path is then the partial route) or "error" (with an "error" message).
+# The searches run on a pool of worker processes so one slow query doesn't hold up the others, and answers go back
+# as soon as they are ready, so a client sending several queries at once can get them back out of order.
+
+# What the workers search over: (graph, landmarks, hierarchy, spatial_index). Set before the pool starts so forked workers
+# inherit it, the same way batch.route_batch_parallel shares the graph.
+_shared = None
+
+def _init_worker(shared, timeout_sec):  # runs once per worker, sets what a spawned worker didn't inherit
+    global _shared
+    _shared = shared
+    main.algo_timeout_sec = timeout_sec
+
+# Answers one query (a dict) on a worker and returns the response dict
+def answer(query):
+    graph, landmarks, hierarchy, spatial_index = _shared
+    started = time.perf_counter_ns()
+    response = {"id": query.get("id")}
+    try:
+        start, goal = snap_to_city(graph, spatial_index, query["start"]), snap_to_city(graph, spatial_index, query["goal"])
+        for city in (start, goal):
+            if city not in graph:
+                raise KeyError(f"'{city}' not found in the road graph")
+        algorithm = str(query.get("algorithm", "a*")).strip().lower()
+        if algorithm == "ch" and hierarchy is None:
+            raise ValueError("The service was started without a contraction hierarchy (--hierarchy)")
+
+        k = query.get("k", 3)
+        if not isinstance(k, int):
+            raise TypeError('"k" has to be a whole number')
+
+        stats = SearchStats()
+        result = batch.run_query(graph, algorithm, start, goal, landmarks, hierarchy, query.get("max_depth"), stats=stats, k=k)
+        if isinstance(result, BudgetExceeded):
+            response.update(status="budget_exceeded", reason=result.reason)
+        else:
+            response["status"] = "ok" if result.path is not None else "no_path"
+        response.update(path=result.path, distance_km=result.distance if result.distance != math.inf else None,
+                        nodes_expanded=stats.nodes_expanded, search_ms=stats.elapsed_ns / 1e6)
+        if isinstance(result, AlternativeRoutes):
+            response["alternatives"] = [{"path": route.path, "distance_km": route.distance} for route in result.alternatives]
+    except (KeyError, TypeError, ValueError) as error:
+        response.update(status="error", error=str(error.args[0]) if error.args else type(error).__name__)
+    response["total_ms"] = (time.perf_counter_ns() - started) / 1e6
+    return response
+
+class RouteService:
+    def __init__(self, shared, workers, timeout_sec):
+        global _shared
+        _shared = shared
+        main.algo_timeout_sec = timeout_sec
+        if workers <= 1:  # one CPU: answer on a single thread, which still keeps the event loop free for I/O
+            self.pool = ThreadPoolExecutor(1)
+        elif "fork" in multiprocessing.get_all_start_methods():
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                            initializer=_init_worker, initargs=(shared, timeout_sec))
+        else:
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(shared, timeout_sec))
+        # Start the workers now, before the event loop has any client sockets open. A worker forked later would inherit
+        # them, and a client would never see its connection close.
+        self.pool.submit(int).result()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def respond(self, line):  # one JSON line in, one JSON line out
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise ValueError("a query has to be a JSON object")
+        except ValueError as error:
+            return json.dumps({"id": None, "status": "error", "error": f"bad query: {error}"}) + "\n"
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(self.pool, answer, query)
+        except Exception as error:  # the worker itself failed (e.g. it was killed), not just the query
+            response = {"id": query.get("id"), "status": "error", "error": f"worker failed: {error!r}"}
+        return json.dumps(response) + "\n"
+
+    # Reads queries from reader until it closes, and writes every answer with write as soon as it is ready
+    async def serve_stream(self, reader, write):
+        pending = set()
+        while line := await reader.readline():
+            if not line.strip():
+                continue
+            task = asyncio.create_task(self.respond(line))
+            task.add_done_callback(lambda done: write(done.result()))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def handle_client(self, reader, writer):
+        try:
+            await self.serve_stream(reader, lambda text: writer.write(text.encode()))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve_stdin(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=1 << 20)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        def write(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        await self.serve_stream(reader, write)
+
+    async def serve_socket(self, host=None, port=None, path=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Serving routes on {path or f'{host}:{port}'}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == "__main__":
+    # python service.py                       JSON lines on stdin, answers on stdout
+    # python service.py --tcp 127.0.0.1:8765  or  --unix /tmp/routes.sock
+    parser = argparse.ArgumentParser(description="Route service answering JSON line queries")
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="listen on a local TCP socket")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="search processes (1 = one thread in this process)")
+    parser.add_argument("--timeout", type=float, default=main.algo_timeout_sec, help="per query time budget in seconds")
+    parser.add_argument("--hierarchy", action="store_true", help="load (or build) hierarchy.bin so 'ch' queries work")
+    parser.add_argument("--adjacencies", default="adjacencies.txt")
+    parser.add_argument("--coordinates", default="coordinates.csv")
+    args = parser.parse_args()
+
+    city_graph = load_city_graph(args.adjacencies, args.coordinates)
+    landmarks = get_landmarks(city_graph, 'landmarks.bin')
+    hierarchy = None
+    if args.hierarchy:
+        from contraction import get_hierarchy
+        hierarchy = get_hierarchy(city_graph, 'hierarchy.bin')
+    service = RouteService((city_graph, landmarks, hierarchy, SpatialIndex(city_graph)), args.workers, args.timeout)
+
+    try:
+        if args.unix:
+            asyncio.run(service.serve_socket(path=args.unix))
+        elif args.tcp:
+            host, _, port = args.tcp.rpartition(":")
+            asyncio.run(service.serve_socket(host or "127.0.0.1", int(port)))
+        else:
+            asyncio.run(service.serve_stdin())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
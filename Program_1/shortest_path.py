@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+import heapq
+import math
+
+import numpy as np
+
+@dataclass  # What a shortest path search returns: the path as node ids (None if unreachable), its length in km, and how much work it took
+class SearchResult:
+    path: list
+    distance: float
+    nodes_expanded: int
+
+@dataclass  # Returned instead of a normal result when a search runs out of budget, path is the best partial progress
+class BudgetExceeded(SearchResult):
+    reason: str = "time"  # "time", "expansions" or "frontier"
+
+# Walks the parent ids back from node and returns the path from the source as a list of ids
+def path_to(parent, node):
+    path = []
+    while node != -1:
+        path.append(node)
+        node = parent[node]
+    return path[::-1]
+
+# Sum of the edge weights along a path of ids
+def path_length(graph, path):
+    total = 0.0
+    for a, b in zip(path, path[1:]):
+        total += min(weight for neighbor, weight in graph.edges(a) if neighbor == b)
+    return total
+
+# Builds the BudgetExceeded result for a search tree: the partial path goes to the explored node closest to the goal.
+# explored is a mask over the node ids (a bytearray or numpy array), so the closest one is found in one vectorized pass.
+def partial_result(graph, budget, parent, explored, goal):
+    explored = np.frombuffer(explored, dtype=bool) if isinstance(explored, bytearray) else np.asarray(explored, dtype=bool)
+    nodes = np.flatnonzero(explored)
+    km = np.nan_to_num(graph.distances_to(goal, nodes), nan=math.inf)  # cities with no coordinates go last
+    path = path_to(parent, int(nodes[np.argmin(km)]))
+    return BudgetExceeded(path, path_length(graph, path), budget.expansions, budget.reason)
+
+# BudgetExceeded for a search that only has its current path (dfs and iddfs)
+def partial_path_result(graph, budget, path):
+    return BudgetExceeded(list(path), path_length(graph, path), budget.expansions, budget.reason)
+
+# Dijkstra / A* over the weighted CityGraph.
+# heuristic(node) has to be a lower bound on the remaining km to the goal that never drops by more than an edge's weight
+# (haversine is), so the first time a node is popped its cost is final. With no heuristic this is plain Dijkstra.
+# Instead of decrease-key, a better cost just pushes a new heap entry and the stale ones are skipped when they are popped.
+# If a SearchBudget is given and runs out, the result is a BudgetExceeded. If a SearchStats is given it is filled in.
+def shortest_path(graph, start, goal, heuristic=None, budget=None, stats=None):
+    if budget is not None:
+        budget.start()
+    if stats is not None:
+        stats.heap_pushes += 1
+    dist = [math.inf] * len(graph)  # best known cost from start to each node
+    parent = [-1] * len(graph)
+    closed = bytearray(len(graph))  # nodes whose cost is final
+    dist[start] = 0.0
+    frontier = [(heuristic(start) if heuristic else 0.0, 0.0, start)]  # (priority, cost, node)
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    nodes_expanded = 0
+
+    while frontier:
+        _, cost, current = heapq.heappop(frontier)
+        if stats is not None:
+            stats.heap_pops += 1
+        if closed[current] or cost > dist[current]:  # stale entry left behind by a later improvement
+            continue
+        if budget is not None and budget.spent(len(frontier)):
+            closed[current] = 1  # counts as explored for the partial path
+            return partial_result(graph, budget, parent, closed, goal)
+        closed[current] = 1
+        nodes_expanded += 1
+        if stats is not None:
+            stats.expand(len(frontier), nodes_expanded, offsets[current + 1] - offsets[current])
+
+        if current == goal:
+            return SearchResult(path_to(parent, goal), cost, nodes_expanded)
+
+        for i in range(offsets[current], offsets[current + 1]):  # relax every edge leaving current
+            neighbor = targets[i]
+            new_cost = cost + weights[i]
+            if new_cost < dist[neighbor] and not closed[neighbor]:
+                dist[neighbor] = new_cost
+                parent[neighbor] = current
+                priority = new_cost + heuristic(neighbor) if heuristic else new_cost
+                heapq.heappush(frontier, (priority, new_cost, neighbor))
+                if stats is not None:
+                    stats.heap_pushes += 1
+
+    return SearchResult(None, math.inf, nodes_expanded)  # goal can't be reached
+
+# Dijkstra from source, returns the (dist, parent) lists. With no targets it runs to every node, otherwise it stops
+# as soon as every node in targets is settled (the lists are then only final for the settled nodes).
+# If a SearchBudget is given and runs out, it returns None instead.
+def single_source(graph, source, targets=None, budget=None):
+    remaining = set(targets) if targets is not None else None
+    dist = [math.inf] * len(graph)
+    parent = [-1] * len(graph)
+    closed = bytearray(len(graph))
+    dist[source] = 0.0
+    frontier = [(0.0, source)]
+    offsets, ends, weights = graph.offsets, graph.targets, graph.weights
+
+    while frontier:
+        cost, current = heapq.heappop(frontier)
+        if closed[current]:
+            continue
+        if budget is not None and budget.spent(len(frontier)):
+            return None
+        closed[current] = 1
+        if remaining is not None:
+            remaining.discard(current)
+            if not remaining:
+                break
+
+        for i in range(offsets[current], offsets[current + 1]):
+            neighbor = ends[i]
+            new_cost = cost + weights[i]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                parent[neighbor] = current
+                heapq.heappush(frontier, (new_cost, neighbor))
+
+    return dist, parent
@@ -0,0 +1,106 @@
+import math
+
+import numpy as np
+
+from graph import R, haversine_radians
+
+# Uniform grid over the city coordinates, for nearest city and bounding box lookups without scanning every city.
+# The coordinates are projected to km on a flat map (x scaled by the cosine of the latitude farthest from the equator,
+# so flat distances never come out longer than the real ones) and bucketed into square cells of cell_km, which by
+# default hold about two cities each. The cities of each cell are a slice of one sorted id array, CSR style.
+class SpatialIndex:
+    def __init__(self, graph, cell_km=None):
+        self.graph = graph
+        lat, lon = np.asarray(graph.lat, dtype=np.float64), np.asarray(graph.lon, dtype=np.float64)
+        nodes = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon))  # cities without coordinates can't be found by location
+        lat_rad, lon_rad = graph.lat_rad[nodes], graph.lon_rad[nodes]
+
+        self.x_scale = R * max(math.cos(np.abs(lat_rad).max()), 0.01) if len(nodes) else R
+        x, y = lon_rad * self.x_scale, lat_rad * R
+        self.x0, self.y0 = (x.min(), y.min()) if len(nodes) else (0.0, 0.0)
+        width_km, height_km = (x.max() - self.x0, y.max() - self.y0) if len(nodes) else (0.0, 0.0)
+        self.cell_km = cell_km or max(math.sqrt(width_km * height_km * 2 / max(len(nodes), 1)), 1e-3)
+        self.columns = int(width_km // self.cell_km) + 1
+        self.rows = int(height_km // self.cell_km) + 1
+
+        column, row = self.cell_of(x, y)
+        keys = column * self.rows + row
+        order = np.argsort(keys, kind='stable')
+        self.nodes = nodes[order]
+        self.cell_offsets = np.zeros(self.columns * self.rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=self.columns * self.rows), out=self.cell_offsets[1:])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def cell_of(self, x, y):  # (column, row) of flat map points, clamped onto the grid
+        column = np.clip(((x - self.x0) // self.cell_km).astype(np.int64), 0, self.columns - 1)
+        row = np.clip(((y - self.y0) // self.cell_km).astype(np.int64), 0, self.rows - 1)
+        return column, row
+
+    def cell_nodes(self, column, row):  # ids of the cities in one cell
+        key = column * self.rows + row
+        return self.nodes[self.cell_offsets[key]:self.cell_offsets[key + 1]]
+
+    # The k cities closest to (lat, lon) in degrees, as (node id, km) pairs from closest to farthest.
+    # Looks through rings of cells around the point's cell, and stops once the k-th closest city found so far is
+    # nearer than anything in the next ring could be.
+    def nearest(self, lat, lon, k=1):
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        lat_rad, lon_rad = math.radians(lat), math.radians(lon)
+        column, row = (int(value) for value in self.cell_of(np.float64(lon_rad * self.x_scale), np.float64(lat_rad * R)))
+        found_nodes, found_km = np.empty(0, dtype=np.int64), np.empty(0)
+
+        for ring in range(max(self.columns, self.rows)):
+            cells = [self.cell_nodes(c, r) for c, r in ring_cells(column, row, ring, self.columns, self.rows)]
+            candidates = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+            if len(candidates):
+                km = haversine_radians(lat_rad, lon_rad, self.graph.lat_rad[candidates], self.graph.lon_rad[candidates])
+                found_nodes, found_km = np.concatenate([found_nodes, candidates]), np.concatenate([found_km, km])
+                best = np.argsort(found_km, kind='stable')[:k]
+                found_nodes, found_km = found_nodes[best], found_km[best]
+            if len(found_nodes) == k and found_km[-1] <= ring * self.cell_km:  # every city past this ring is farther
+                break
+        return list(zip(found_nodes.tolist(), found_km.tolist()))
+
+    # Ids of every city inside the box, edges included (south <= lat <= north and west <= lon <= east, in degrees)
+    def within(self, south, north, west, east):
+        if not len(self):
+            return []
+        low = self.cell_of(np.float64(math.radians(west) * self.x_scale), np.float64(math.radians(south) * R))
+        high = self.cell_of(np.float64(math.radians(east) * self.x_scale), np.float64(math.radians(north) * R))
+        cells = [self.cell_nodes(c, r) for c in range(int(low[0]), int(high[0]) + 1) for r in range(int(low[1]), int(high[1]) + 1)]
+        candidates = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        lat, lon = np.asarray(self.graph.lat)[candidates], np.asarray(self.graph.lon)[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(candidates[inside]).tolist()
+
+    def snap(self, lat, lon):  # id of the city closest to a GPS point
+        found = self.nearest(lat, lon)
+        if not found:
+            raise ValueError("The road graph has no cities with coordinates")
+        return found[0][0]
+
+# (column, row) of every grid cell exactly ring cells away from (column, row), in the Chebyshev sense
+def ring_cells(column, row, ring, columns, rows):
+    if ring == 0:
+        return [(column, row)]
+    cells = []
+    for c in range(max(column - ring, 0), min(column + ring, columns - 1) + 1):
+        for r in (row - ring, row + ring):
+            if 0 <= r < rows:
+                cells.append((c, r))
+    for r in range(max(row - ring + 1, 0), min(row + ring - 1, rows - 1) + 1):
+        for c in (column - ring, column + ring):
+            if 0 <= c < columns:
+                cells.append((c, r))
+    return cells
+
+# Turns a place into a city name: names pass through, (lat, lon) GPS points snap to the closest city
+def snap_to_city(graph, index, place):
+    if isinstance(place, str):
+        return place
+    lat, lon = place
+    return graph.names[index.snap(lat, lon)]
@@ -1,8 +1,13 @@
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Set, Tuple
-import random
-import math
+from typing import List, Optional, Tuple
 from collections import defaultdict
+import argparse
+import copy
+import multiprocessing
+import os
+
+import numpy as np
 
 @dataclass  # Creation of dataclass that has a name, enrollment, pref. faculty, and other faculty
 class Activity:
@@ -23,8 +28,24 @@ class ScheduleItem:
     time: str
     facilitator: str
 
+# A schedule (genome) is a small int array with one row per activity, in the order of ScheduleOptimizer.activities,
+# holding the indices of its room, time and facilitator. A population is a stack of them, shape (size, activities, 3).
+ROOM, TIME, FACILITATOR = 0, 1, 2  # columns of a genome row
+@dataclass  # Where a run of the genetic algorithm got to, so it can carry on later (islands evolve a few generations at a time)
+class EvolutionState:
+    population: np.ndarray
+    mutation_rate: float
+    generation: int = 0
+    best_schedule: Optional[np.ndarray] = None
+    best_fitness: float = float('-inf')
+    prev_avg_fitness: float = float('-inf')
+    converged: bool = False
+    cache: Optional["FitnessCache"] = None  # remembers the fitness of schedules already scored, if given
+
+FITNESS_UNIT = 20  # every reward and penalty is a whole number of 1/20 fitness points, so IncrementalFitness counts in those
+
 class ScheduleOptimizer:
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
         # Initialize activities with the name of the class, expected enrollment, preferred faculty, and other possible faculty
         self.activities = {
             "SLA100A": Activity("SLA100A", 50, 
@@ -89,36 +110,78 @@ class ScheduleOptimizer:
         self.facilitators = ["Lock", "Glen", "Banks", "Richards", "Shaw",  # all the available faculty for the activities
                            "Singer", "Uther", "Tyler", "Numen", "Zeldin"]
 
-    def create_random_schedule(self) -> List[ScheduleItem]:  # Create a schedule and expect a list of scheduleItems to be returned
-        schedule = []  # init a blank schedule
-        for activity_name in self.activities.keys():  # Generate a random schedule
-            schedule.append(ScheduleItem(
-                activity=activity_name,
-                room=random.choice(list(self.rooms.keys())),
-                time=random.choice(self.times),
-                facilitator=random.choice(self.facilitators)
-            ))
-        return schedule
-
-    def calculate_fitness(self, schedule: List[ScheduleItem]) -> float:  # Calculates the fitness of the given schedule and outputs the fitness score as a float
+        self.activity_names = list(self.activities.keys())  # row order of a genome
+        self.room_names = list(self.rooms.keys())
+        self.sla100_sections = [self.activity_names.index(name) for name in ["SLA100A", "SLA100B"]]  # rows for the special rules
+        self.sla191_sections = [self.activity_names.index(name) for name in ["SLA191A", "SLA191B"]]
+        self.gene_choices = np.array([len(self.room_names), len(self.times), len(self.facilitators)])  # values per column
+        self.rng = np.random.default_rng(seed)
+        self._build_fitness_tables()
+
+    # Tables of what each activity's room and facilitator add to the fitness, for calculate_population_fitness.
+    # They hold the same amounts calculate_fitness adds, looked up by index instead of worked out per schedule.
+    def _build_fitness_tables(self):
+        activity_count = len(self.activity_names)
+        self.room_terms = np.zeros((activity_count, len(self.room_names), 2))  # [room size reward/penalty, extra 6x penalty]
+        self.facilitator_terms = np.zeros((activity_count, len(self.facilitators)))
+        for a, activity in enumerate(self.activities.values()):
+            for r, room in enumerate(self.rooms.values()):
+                if room.capacity < activity.enrollment:
+                    self.room_terms[a, r, 0] = -0.5  # room too small
+                elif room.capacity > 3 * activity.enrollment:
+                    self.room_terms[a, r, 0] = -0.2  # room 3 times the needed size
+                    if room.capacity > 6 * activity.enrollment:
+                        self.room_terms[a, r, 1] = -0.4  # room 6 times the needed size
+                else:
+                    self.room_terms[a, r, 0] = 0.3
+            for f, facilitator in enumerate(self.facilitators):
+                if facilitator in activity.preferred_facilitators:
+                    self.facilitator_terms[a, f] = 0.5
+                elif facilitator in activity.other_facilitators:
+                    self.facilitator_terms[a, f] = 0.2
+                else:
+                    self.facilitator_terms[a, f] = -0.1
+
+        counts = np.arange(activity_count + 1)  # how many activities a facilitator has (at one time, or in total)
+        self.busy_terms = np.where(counts == 1, 0.2, np.where(counts > 1, -0.2, 0.0))  # by activities at the same time
+        self.load_terms = np.zeros((len(self.facilitators), activity_count + 1))  # by facilitator and total activities
+        for f, facilitator in enumerate(self.facilitators):
+            self.load_terms[f] = np.where(counts > 4, -0.5, np.where((counts < 2) & (facilitator != "Tyler"), -0.4, 0.0))
+
+    def create_random_population(self, size: int) -> np.ndarray:  # size random schedules, shape (size, activities, 3)
+        return self.rng.integers(0, self.gene_choices, size=(size, len(self.activity_names), 3), dtype=np.int8)
+
+    def create_random_schedule(self) -> np.ndarray:  # Create one random schedule (genome)
+        return self.create_random_population(1)[0]
+
+    def decode(self, schedule: np.ndarray) -> List[ScheduleItem]:  # Turns a genome back into ScheduleItems
+        return [ScheduleItem(activity=self.activity_names[activity],
+                             room=self.room_names[room],
+                             time=self.times[time],
+                             facilitator=self.facilitators[facilitator])
+                for activity, (room, time, facilitator) in enumerate(schedule.tolist())]
+
+    def calculate_fitness(self, schedule: np.ndarray) -> float:  # Calculates the fitness of the given schedule and outputs the fitness score as a float
         fitness = 0.0  # init the fitness to 0
-        
+        genes = schedule.tolist()  # plain ints are faster to look up than numpy scalars
+
         time_room_map = defaultdict(set)  # Which activities are in each room at each time
         facilitator_time_map = defaultdict(list)  # what activities each facilitator is doing at each time
         facilitator_count = defaultdict(int)  # total activities per facilitator
-        
-        for item in schedule:  # Goes through all the schedule items
-            time_room_map[f"{item.time}_{item.room}"].add(item.activity)  # can track conflicts
-            facilitator_time_map[f"{item.facilitator}_{item.time}"].append(item.activity)  # Track faculty assignments by time
-            facilitator_count[item.facilitator] += 1  # Total activies for faculty member
 
-        for item in schedule:
+        for activity, (room, time, facilitator) in enumerate(genes):  # Goes through all the schedule items
+            time_room_map[(time, room)].add(activity)  # can track conflicts
+            facilitator_time_map[(facilitator, time)].append(activity)  # Track faculty assignments by time
+            facilitator_count[facilitator] += 1  # Total activies for faculty member
+
+        for activity_index, (room_index, time, facilitator_index) in enumerate(genes):
             # If there's more than one activity in this room at this time
-            if len(time_room_map[f"{item.time}_{item.room}"]) > 1:
+            if len(time_room_map[(time, room_index)]) > 1:
                 fitness -= 0.5  # punish the algo
 
-            activity = self.activities[item.activity]
-            room = self.rooms[item.room]
+            activity = self.activities[self.activity_names[activity_index]]
+            room = self.rooms[self.room_names[room_index]]
+            facilitator = self.facilitators[facilitator_index]
 
             if room.capacity < activity.enrollment:
                 fitness -= 0.5  # penalty for small room
@@ -130,22 +193,22 @@ class ScheduleOptimizer:
                 fitness += 0.3  # if no penalty, reward
 
             # Check facilitator preference
-            if item.facilitator in activity.preferred_facilitators:
+            if facilitator in activity.preferred_facilitators:
                 fitness += 0.5  # preferred faculty is rewarded
-            elif item.facilitator in activity.other_facilitators:
+            elif facilitator in activity.other_facilitators:
                 fitness += 0.2  # other Faculty is awarded a little
             else:
                 fitness -= 0.1  # random faculty is punished
 
             # Check facilitator load
-            if len(facilitator_time_map[f"{item.facilitator}_{item.time}"]) == 1:
+            if len(facilitator_time_map[(facilitator_index, time)]) == 1:
                 fitness += 0.2  # faculty only has one activity at this time, reward
-            elif len(facilitator_time_map[f"{item.facilitator}_{item.time}"]) > 1:
+            elif len(facilitator_time_map[(facilitator_index, time)]) > 1:
                 fitness -= 0.2  # the faculty must be in two places at once, so punish
 
-            if facilitator_count[item.facilitator] > 4:
+            if facilitator_count[facilitator_index] > 4:
                 fitness -= 0.5  # faculty is overworked, punish
-            elif facilitator_count[item.facilitator] < 2 and item.facilitator != "Tyler":
+            elif facilitator_count[facilitator_index] < 2 and facilitator != "Tyler":
                 fitness -= 0.4  # only tyler is allowed to do a little bit of work, so punish others
 
         # Special rules for SLA101 and SLA191
@@ -153,17 +216,44 @@ class ScheduleOptimizer:
 
         return fitness  # returnes the total fitness for the schedule
 
-    def _apply_special_rules(self, schedule: List[ScheduleItem], fitness: float):
-        # get schedule items for SLA100 and SLA191 sections with their times and rooms
-        sla100_schedules = [(item, self.times.index(item.time), item.room) 
-                            for item in schedule 
-                            if item.activity in ["SLA100A", "SLA100B"]]
-        sla191_schedules = [(item, self.times.index(item.time), item.room) 
-                            for item in schedule 
-                            if item.activity in ["SLA191A", "SLA191B"]]
+    # Fitness of every schedule in a population (shape (size, activities, 3)) in one pass, equal to calculate_fitness on
+    # each of them. Room and facilitator clashes are counted with one bincount over (schedule, slot) keys, and every
+    # reward and penalty is looked up in the precomputed tables. The terms are summed with a cumsum in the same order
+    # calculate_fitness adds them, so the floating point totals come out exactly the same.
+    def calculate_population_fitness(self, population: np.ndarray) -> np.ndarray:
+        size, activity_count = population.shape[:2]
+        room_count, time_count, facilitator_count = (int(choices) for choices in self.gene_choices)
+        rooms = population[:, :, ROOM].astype(np.intp)
+        times = population[:, :, TIME].astype(np.intp)
+        facilitators = population[:, :, FACILITATOR].astype(np.intp)
+
+        schedule = np.arange(size)[:, None]
+        room_slots = (schedule * time_count + times) * room_count + rooms  # one key per (schedule, time, room)
+        in_room = np.bincount(room_slots.ravel(), minlength=size * time_count * room_count)[room_slots]
+        facilitator_slots = (schedule * facilitator_count + facilitators) * time_count + times  # (schedule, facilitator, time)
+        at_once = np.bincount(facilitator_slots.ravel(), minlength=size * facilitator_count * time_count)[facilitator_slots]
+        facilitator_keys = schedule * facilitator_count + facilitators  # (schedule, facilitator)
+        total = np.bincount(facilitator_keys.ravel(), minlength=size * facilitator_count)[facilitator_keys]
+
+        activity = np.arange(activity_count)
+        terms = np.stack([np.where(in_room > 1, -0.5, 0.0),  # room shared with another activity at the same time
+                          self.room_terms[activity, rooms, 0],
+                          self.room_terms[activity, rooms, 1],
+                          self.facilitator_terms[activity, facilitators],
+                          self.busy_terms[at_once],
+                          self.load_terms[facilitators, total]], axis=2)
+        # calculate_fitness drops what _apply_special_rules returns, so the SLA100/SLA191 rules aren't counted here either
+        return np.cumsum(terms.reshape(size, -1), axis=1)[:, -1]
+
+    def _apply_special_rules(self, schedule: np.ndarray, fitness: float):
+        # get (time, room) of the SLA100 and SLA191 sections
+        sla100_schedules = [(int(schedule[activity, TIME]), self.room_names[schedule[activity, ROOM]])
+                            for activity in self.sla100_sections]
+        sla191_schedules = [(int(schedule[activity, TIME]), self.room_names[schedule[activity, ROOM]])
+                            for activity in self.sla191_sections]
 
         if len(sla100_schedules) == 2:
-            time1, time2 = sla100_schedules[0][1], sla100_schedules[1][1]
+            time1, time2 = sla100_schedules[0][0], sla100_schedules[1][0]
         if abs(time1 - time2) > 4:
             fitness += 0.5  # Separated by 4 hours or more, reward
         elif time1 == time2:
@@ -171,23 +261,23 @@ class ScheduleOptimizer:
 
         # Same thing for SLA191
         if len(sla191_schedules) == 2:
-            time1, time2 = sla191_schedules[0][1], sla191_schedules[1][1]
+            time1, time2 = sla191_schedules[0][0], sla191_schedules[1][0]
             if abs(time1 - time2) > 4:
                 fitness += 0.5
             elif time1 == time2:
                 fitness -= 0.5
 
         # Check SLA191 and SLA101 relationships
-        for sla100_item, sla100_time, sla100_room in sla100_schedules:
-            for sla191_item, sla191_time, sla191_room in sla191_schedules:
+        for sla100_time, sla100_room in sla100_schedules:
+            for sla191_time, sla191_room in sla191_schedules:
                 time_diff = abs(sla100_time - sla191_time)
-            
+
                 if time_diff == 1:
                     fitness += 0.5  # Consecutive time slots are rewarded
                     # Check building constraint for consecutive slots
                     sla100_in_target = any(building in sla100_room for building in ["Roman", "Beach"])
                     sla191_in_target = any(building in sla191_room for building in ["Roman", "Beach"])
-                    
+
                     if sla100_in_target != sla191_in_target:
                         fitness -= 0.4  # Penalty for having only one activity in Roman/Beach
                 # Check one-hour separation
@@ -198,85 +288,154 @@ class ScheduleOptimizer:
                     fitness -= 0.25  # Same time slot, punish
         return fitness
 
-    def crossover(self, parent1: List[ScheduleItem], parent2: List[ScheduleItem]) -> List[ScheduleItem]:  # taking the schedules and crossingover their genes
-        crossover_point = random.randint(1, len(parent1) - 1)
-        child = parent1[:crossover_point] + parent2[crossover_point:]
-        return child
-
-    def mutate(self, schedule: List[ScheduleItem], mutation_rate: float) -> List[ScheduleItem]:  # Will mutate into a new schedule
-        mutated_schedule = []
-        for item in schedule:
-            if random.random() < mutation_rate:
-                # Randomly choose what to mutate
-                mutation_type = random.choice(["room", "time", "facilitator"])  # random mutation
-                new_item = ScheduleItem(  # make the new item
-                    activity=item.activity,
-                    room=random.choice(list(self.rooms.keys())) if mutation_type == "room" else item.room,
-                    time=random.choice(self.times) if mutation_type == "time" else item.time,
-                    facilitator=random.choice(self.facilitators) if mutation_type == "facilitator" else item.facilitator
-                )
-                mutated_schedule.append(new_item)  # add it to the schedule
-            else:
-                mutated_schedule.append(item)
-        return mutated_schedule  # return the new schedule
-
-    def optimize(self, population_size: int = 500, generations: int = 100, 
-                mutation_rate: float = 0.01) -> Tuple[List[ScheduleItem], float]:
+    # One point crossover. Works on a pair of genomes or on two whole stacks of them at once (each pair gets its own point)
+    def crossover(self, parent1: np.ndarray, parent2: np.ndarray) -> np.ndarray:
+        activity_count = parent1.shape[-2]
+        crossover_point = self.rng.integers(1, activity_count, size=parent1.shape[:-2] + (1,))
+        from_parent1 = np.arange(activity_count) < crossover_point  # activities before the point come from parent1
+        return np.where(from_parent1[..., None], parent1, parent2)
+
+    # Every activity mutates with probability mutation_rate: one of its room, time or facilitator is redrawn at random.
+    # Works on one genome or a whole population, and returns a mutated copy.
+    def mutate(self, schedules: np.ndarray, mutation_rate: float) -> np.ndarray:
+        mutated = schedules.copy()
+        hits = np.nonzero(self.rng.random(schedules.shape[:-1]) < mutation_rate)  # which activities mutate
+        genes = self.rng.integers(0, 3, size=len(hits[0]))  # random mutation: room, time or facilitator
+        mutated[hits + (genes,)] = self.rng.integers(0, self.gene_choices[genes])
+        return mutated  # return the new schedule
+
+    # With incremental=True the fitness of each child is worked out from its closer parent's with IncrementalFitness,
+    # instead of scoring the whole population from scratch every generation.
+    # With a FitnessCache the fitness of schedules already seen is looked up in it, and its report() gives the hit rate
+    # per generation afterwards.
+    def optimize(self, population_size: int = 500, generations: int = 100, mutation_rate: float = 0.01,
+                 incremental: bool = False, cache: Optional["FitnessCache"] = None) -> Tuple[np.ndarray, float]:
         # Initialize population
-        population = [self.create_random_schedule() for _ in range(population_size)]
-        
-        best_fitness = float('-inf')
-        best_schedule = None
-        prev_avg_fitness = float('-inf')
-        
-        for generation in range(generations):
+        state = EvolutionState(self.create_random_population(population_size), mutation_rate, cache=cache)
+        self.evolve(state, generations, incremental)
+        return state.best_schedule, state.best_fitness
+
+    # Runs up to generations more generations of the genetic algorithm on state, stopping early once it converges
+    def evolve(self, state: EvolutionState, generations: int, incremental: bool = False):
+        if incremental and state.cache is not None:
+            raise ValueError("The fitness cache only works with the batch scorer, not with incremental=True")
+        population = state.population
+        scores = IncrementalFitness(self, population) if incremental else None
+
+        for generation in range(state.generation, state.generation + generations):
+            if state.converged:
+                break
             # Calculate fitness for all schedules
-            fitness_scores = [(schedule, self.calculate_fitness(schedule)) 
-                            for schedule in population]
-            
+            if incremental:
+                fitness_scores = scores.fitness
+            elif state.cache is not None:
+                fitness_scores = state.cache.score(self, population, generation)
+            else:
+                fitness_scores = self.calculate_population_fitness(population)
+
             # Track best schedule
-            current_best = max(fitness_scores, key=lambda x: x[1])
-            if current_best[1] > best_fitness:
-                best_fitness = current_best[1]
-                best_schedule = current_best[0]
-            
+            current_best = int(np.argmax(fitness_scores))
+            if fitness_scores[current_best] > state.best_fitness:
+                state.best_fitness = float(fitness_scores[current_best])
+                state.best_schedule = population[current_best].copy()
+
             # Calculate average fitness
-            avg_fitness = sum(score for _, score in fitness_scores) / len(fitness_scores)
-            
+            avg_fitness = float(fitness_scores.mean())
+
             # Check for convergence after 100 generations
             if generation >= 100:
-                improvement = (avg_fitness - prev_avg_fitness) / abs(prev_avg_fitness)
+                improvement = (avg_fitness - state.prev_avg_fitness) / abs(state.prev_avg_fitness)
                 if improvement < 0.01:
+                    state.converged = True
                     break
-            
-            prev_avg_fitness = avg_fitness
-            
-            # Create new population
-            new_population = []
-            while len(new_population) < population_size:
-                # Tournament selection
-                tournament_size = 5
-                tournament = random.sample(fitness_scores, tournament_size)
-                parent1 = max(tournament, key=lambda x: x[1])[0]
-                tournament = random.sample(fitness_scores, tournament_size)
-                parent2 = max(tournament, key=lambda x: x[1])[0]
-                
-                # Crossover and mutation
-                child = self.crossover(parent1, parent2)
-                child = self.mutate(child, mutation_rate)
-                new_population.append(child)
-            
-            population = new_population
-            
+
+            state.prev_avg_fitness = avg_fitness
+
+            # Create new population: tournament selection for both parents of every child, then crossover and mutation
+            parents1 = self.tournament(fitness_scores, len(population))
+            parents2 = self.tournament(fitness_scores, len(population))
+            population = self.mutate(self.crossover(population[parents1], population[parents2]), state.mutation_rate)
+            if incremental:
+                scores = scores.breed(population, parents1, parents2)
+
             # Adaptive mutation rate
             if generation % 10 == 0:
-                mutation_rate *= 0.95  # Gradually reduce mutation rate
-        
-        return best_schedule, best_fitness
-
-    def print_schedule(self, schedule: List[ScheduleItem]) -> str:  # Simple printing function
+                state.mutation_rate *= 0.95  # Gradually reduce mutation rate
+            state.generation = generation + 1
+
+        state.population = population
+
+    # Island model: islands separate populations of population_size evolve side by side, each on its own random stream
+    # and, with workers > 1, in its own process. Every migration_interval generations the migrants fittest schedules
+    # of each island replace the least fit ones of its neighbours: the next island round a ring (topology="ring") or
+    # every other island (topology="full"). The islands meet only at those points, so a seed gives the same result
+    # whatever the number of workers. Returns the best schedule found on any island and its fitness.
+    # caches, if given, holds one FitnessCache per island, and each ends up with its island's lookups.
+    def optimize_islands(self, islands: int = 4, population_size: int = 500, generations: int = 100,
+                         mutation_rate: float = 0.01, migration_interval: int = 10, migrants: int = 5,
+                         topology: str = "ring", workers: Optional[int] = None, incremental: bool = False,
+                         caches: Optional[List["FitnessCache"]] = None) -> Tuple[np.ndarray, float]:
+        if topology not in ("ring", "full"):
+            raise ValueError(f"Unknown migration topology '{topology}' (use 'ring' or 'full')")
+        if caches is not None and len(caches) != islands:
+            raise ValueError(f"Got {len(caches)} fitness caches for {islands} islands")
+        optimizers = []
+        for rng in self.rng.spawn(islands):  # independent random streams, all derived from this optimizer's seed
+            island = copy.copy(self)
+            island.rng = rng
+            optimizers.append(island)
+        states = [EvolutionState(island.create_random_population(population_size), mutation_rate,
+                                 cache=caches[i] if caches is not None else None)
+                  for i, island in enumerate(optimizers)]
+
+        workers = min(workers or os.cpu_count() or 1, islands)
+        pool = None
+        if workers > 1:
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            pool = ProcessPoolExecutor(workers, mp_context=context)
+        try:
+            done = 0
+            while done < generations and not all(state.converged for state in states):
+                epoch = min(migration_interval, generations - done)
+                jobs = [(island, state, epoch, incremental) for island, state in zip(optimizers, states)]
+                results = list(pool.map(_evolve_island, jobs)) if pool else [_evolve_island(job) for job in jobs]
+                optimizers, states = [island for island, _ in results], [state for _, state in results]
+                done += epoch
+                if done < generations:
+                    self._migrate(states, migrants, topology)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if caches is not None:  # the worker processes filled in copies of them
+            for cache, state in zip(caches, states):
+                if state.cache is not cache:
+                    vars(cache).update(vars(state.cache))
+        best = max(states, key=lambda state: state.best_fitness)  # first island wins a tie
+        return best.best_schedule, best.best_fitness
+
+    # Copies the fittest schedules of every island over the least fit ones of the islands it sends to
+    def _migrate(self, states: List[EvolutionState], migrants: int, topology: str):
+        fitness = [self.calculate_population_fitness(state.population) for state in states]
+        emigrants = [state.population[np.argsort(-scores, kind="stable")[:migrants]] for state, scores in zip(states, fitness)]
+        for i, (state, scores) in enumerate(zip(states, fitness)):
+            if topology == "ring":
+                arriving = emigrants[i - 1]  # from the previous island round the ring
+            else:
+                arriving = np.concatenate([emigrants[j] for j in range(len(states)) if j != i])
+            arriving = arriving[:len(state.population)]
+            worst = np.argsort(scores, kind="stable")[:len(arriving)]
+            state.population = state.population.copy()
+            state.population[worst] = arriving
+
+    # Indices of count tournament winners, each the fittest of tournament_size individuals drawn at random
+    def tournament(self, fitness_scores: np.ndarray, count: int, tournament_size: int = 5) -> np.ndarray:
+        entrants = self.rng.integers(0, len(fitness_scores), size=(count, tournament_size))
+        return entrants[np.arange(count), np.argmax(fitness_scores[entrants], axis=1)]
+
+    def print_schedule(self, schedule: np.ndarray) -> str:  # Simple printing function
         output = []
-        schedule.sort(key=lambda x: (x.time, x.room))
+        schedule = sorted(self.decode(schedule), key=lambda x: (x.time, x.room))
         
         output.append("Final Schedule:")
         output.append("-" * 80)
@@ -299,13 +458,261 @@ class ScheduleOptimizer:
         
         return "\n".join(output)
 
+# Fitness of a population kept up to date gene by gene. Besides the genomes it keeps, for every schedule, how many
+# activities each room holds at each time, how many each facilitator has at each time and in total, and the score
+# (in exact 1/20 points, so updates never drift). Every fitness term of calculate_fitness depends on one of those
+# counts or on a single activity's own room and facilitator, so a slot holding c activities is worth a fixed
+# amount (e.g. c * -0.5 for a shared room), and changing an activity only rescores its own terms and the slots it
+# leaves and joins, whatever the number of activities.
+# The SLA100/SLA191 pair rules are kept in special_points and rescored only when one of those four sections changes.
+# calculate_fitness drops them, so they only count towards fitness with special_rules=True.
+class IncrementalFitness:
+    def __init__(self, optimizer: ScheduleOptimizer, population: np.ndarray, special_rules: bool = False):
+        self.optimizer = optimizer
+        self.special_rules = special_rules
+        activity_count = len(optimizer.activity_names)
+        self.room_count, self.time_count, self.facilitator_count = (int(choices) for choices in optimizer.gene_choices)
+
+        # points of one activity's own room and facilitator, by [activity, room, facilitator]
+        own_terms = optimizer.room_terms.sum(axis=2)[:, :, None] + optimizer.facilitator_terms[:, None, :]
+        self.own_points = np.rint(own_terms * FITNESS_UNIT).astype(np.int64)
+        # points of a whole slot holding c activities, by [slot, c]
+        counts = np.arange(activity_count + 1)
+        shared_room = np.where(counts > 1, -0.5 * counts, 0.0)
+        self.room_slot_points = np.rint(np.tile(shared_room, (self.time_count * self.room_count, 1)) * FITNESS_UNIT).astype(np.int64)
+        self.busy_slot_points = np.rint(np.tile(optimizer.busy_terms * counts, (self.facilitator_count * self.time_count, 1))
+                                        * FITNESS_UNIT).astype(np.int64)
+        self.load_slot_points = np.rint(optimizer.load_terms * counts * FITNESS_UNIT).astype(np.int64)
+        self.special_rows = np.array(optimizer.sla100_sections + optimizer.sla191_sections)
+        self.roman_or_beach = np.array([any(building in room for building in ["Roman", "Beach"]) for room in optimizer.room_names])
+
+        self.population = population.copy()
+        size = len(population)
+        rooms, times, facilitators = (population[:, :, column].astype(np.intp) for column in (ROOM, TIME, FACILITATOR))
+        self.room_slots = self._count(size, times * self.room_count + rooms, self.time_count * self.room_count)
+        self.busy_slots = self._count(size, facilitators * self.time_count + times, self.facilitator_count * self.time_count)
+        self.load_slots = self._count(size, facilitators, self.facilitator_count)
+        self.points = (self.own_points[np.arange(activity_count), rooms, facilitators].sum(axis=1)
+                       + self._slot_points(self.room_slots, self.room_slot_points)
+                       + self._slot_points(self.busy_slots, self.busy_slot_points)
+                       + self._slot_points(self.load_slots, self.load_slot_points))
+        self.special_points = self._special_points(self.population)
+
+    @staticmethod
+    def _count(size: int, slots: np.ndarray, slot_count: int) -> np.ndarray:  # activities per slot, shape (size, slot_count)
+        keys = np.arange(size)[:, None] * slot_count + slots
+        return np.bincount(keys.ravel(), minlength=size * slot_count).reshape(size, slot_count)
+
+    @staticmethod
+    def _slot_points(slots: np.ndarray, slot_points: np.ndarray) -> np.ndarray:  # points of every slot, summed per schedule
+        return slot_points[np.arange(slots.shape[1]), slots].sum(axis=1)
+
+    # Points of the SLA100/SLA191 rules (as _apply_special_rules works them out) for each of the given schedules
+    def _special_points(self, schedules: np.ndarray) -> np.ndarray:
+        times = schedules[:, self.special_rows, TIME].astype(np.int64)
+        in_target = self.roman_or_beach[schedules[:, self.special_rows, ROOM]]
+        points = np.zeros(len(schedules), dtype=np.int64)
+        for first, second in [(0, 1), (2, 3)]:  # the two SLA100 sections, then the two SLA191 sections
+            apart = np.abs(times[:, first] - times[:, second])
+            points += np.where(apart > 4, 10, np.where(apart == 0, -10, 0))
+        for sla100 in (0, 1):
+            for sla191 in (2, 3):
+                apart = np.abs(times[:, sla100] - times[:, sla191])
+                points += np.where(apart == 1, 10 - 8 * (in_target[:, sla100] != in_target[:, sla191]),
+                                   np.where(apart == 2, 5, np.where(apart == 0, -5, 0)))
+        return points
+
+    @property
+    def fitness(self) -> np.ndarray:  # fitness of every schedule
+        return (self.points + self.special_points * self.special_rules) / FITNESS_UNIT
+
+    # Gives activities[i] of schedule schedules[i] the genes new_genes[i] (a room, time, facilitator row).
+    # Each (schedule, activity) pair may only appear once per call.
+    def change(self, schedules: np.ndarray, activities: np.ndarray, new_genes: np.ndarray):
+        old_genes = self.population[schedules, activities].astype(np.intp)
+        new_genes = np.asarray(new_genes).astype(np.intp)
+        old_rooms, old_times, old_facilitators = old_genes.T
+        new_rooms, new_times, new_facilitators = new_genes.T
+
+        np.add.at(self.points, schedules, self.own_points[activities, new_rooms, new_facilitators]
+                  - self.own_points[activities, old_rooms, old_facilitators])
+        self._move(self.room_slots, self.room_slot_points, schedules,
+                   old_times * self.room_count + old_rooms, new_times * self.room_count + new_rooms)
+        self._move(self.busy_slots, self.busy_slot_points, schedules,
+                   old_facilitators * self.time_count + old_times, new_facilitators * self.time_count + new_times)
+        self._move(self.load_slots, self.load_slot_points, schedules, old_facilitators, new_facilitators)
+        self.population[schedules, activities] = new_genes
+
+        special = np.unique(schedules[np.isin(activities, self.special_rows)])  # schedules whose pair rules need rescoring
+        if len(special):
+            self.special_points[special] = self._special_points(self.population[special])
+
+    # Moves one activity per entry of schedules from old_slots to new_slots, and rescores only the slots touched
+    def _move(self, slots: np.ndarray, slot_points: np.ndarray, schedules: np.ndarray, old_slots: np.ndarray, new_slots: np.ndarray):
+        slot_count = slots.shape[1]
+        flat = slots.reshape(-1)
+        leaving, joining = schedules * slot_count + old_slots, schedules * slot_count + new_slots
+        touched = np.unique(np.concatenate([leaving, joining]))
+        before = slot_points[touched % slot_count, flat[touched]]
+        np.subtract.at(flat, leaving, 1)
+        np.add.at(flat, joining, 1)
+        np.add.at(self.points, touched // slot_count, slot_points[touched % slot_count, flat[touched]] - before)
+
+    # Scores for a new generation: each child starts from a copy of whichever of its two parents (indices into this
+    # population) shares more genes with it, and then only the activities that differ are changed.
+    def breed(self, children: np.ndarray, parents1: np.ndarray, parents2: np.ndarray) -> "IncrementalFitness":
+        differs1 = differing_activities(children, self.population[parents1])
+        differs2 = differing_activities(children, self.population[parents2])
+        closer2 = differs2.sum(axis=1) < differs1.sum(axis=1)
+        parents = np.where(closer2, parents2, parents1)
+
+        bred = copy.copy(self)
+        for name in ("population", "room_slots", "busy_slots", "load_slots", "points", "special_points"):
+            setattr(bred, name, getattr(self, name)[parents])  # fancy indexing copies
+        schedules, activities = np.nonzero(np.where(closer2[:, None], differs2, differs1))
+        bred.change(schedules, activities, children[schedules, activities])
+        return bred
+
+@dataclass  # How one generation's lookups in a FitnessCache went
+class CacheGenerationStats:
+    generation: int
+    lookups: int  # schedules scored
+    hits: int  # found in the cache, or a copy of another schedule of the same generation
+    entries: int  # cache size afterwards
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+# Bounded cache of schedule fitness with generation-aged eviction: when it holds more than max_entries schedules, the
+# ones used longest ago (by generation) go first. Each schedule is keyed by a 64 bit hash of its genes, worked out for
+# the whole population at once. The hashes are kept in a sorted numpy array (the genes themselves sit in a fixed store,
+# by slot), so a generation's lookups are one searchsorted and only the distinct schedules that miss get scored, in
+# one batch. A hit is checked against the stored genes, so a hash collision is just a miss. The fitness of a schedule
+# doesn't depend on the rest of the population, so the scores are exactly those of calculate_population_fitness.
+# It is a diagnostic more than a speedup: the hashing and the sorted inserts cost about as much as scoring a batch, so
+# it only pays off at high hit rates. With main's settings (mutation rate 0.1, 11 activities) about 5% of lookups hit
+# and it roughly halves the generations per second.
+class FitnessCache:
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.keys = np.empty(0, dtype=np.uint64)  # sorted hashes
+        self.slots = np.empty(0, dtype=np.int64)  # where each entry's schedule is in genes
+        self.fitness = np.empty(0)
+        self.last_used = np.empty(0, dtype=np.int64)  # generation each entry was last looked up in
+        self.genes = None  # room for max_entries schedules, made on first use
+        self.free_slots = np.arange(max_entries)[::-1]  # used from the end
+        self.history: List[CacheGenerationStats] = []
+        self.multipliers = None  # one random odd 64 bit multiplier per gene, made on first use
+
+    def __len__(self):
+        return len(self.keys)
+
+    def genome_hashes(self, population: np.ndarray) -> np.ndarray:  # one uint64 per schedule
+        genes = population.reshape(len(population), -1).astype(np.uint64)
+        if self.multipliers is None or len(self.multipliers) != genes.shape[1]:
+            self.multipliers = np.random.default_rng(0).integers(0, 2**63, size=genes.shape[1], dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        return genes @ self.multipliers  # wraps around mod 2**64, which is fine for a hash
+
+    # Fitness of every schedule of population, scoring only the ones that aren't cached
+    def score(self, optimizer: "ScheduleOptimizer", population: np.ndarray, generation: int) -> np.ndarray:
+        hashes = self.genome_hashes(population)
+        distinct, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        copies = np.flatnonzero(first[inverse] != np.arange(len(population)))  # schedules hashing like an earlier one
+        if not np.array_equal(population[copies], population[first[inverse[copies]]]):  # two different schedules share a hash
+            self.history.append(CacheGenerationStats(generation, len(population), 0, len(self)))
+            return optimizer.calculate_population_fitness(population)
+        if self.genes is None:
+            self.genes = np.empty((self.max_entries,) + population.shape[1:], dtype=population.dtype)
+
+        at = np.minimum(np.searchsorted(self.keys, distinct), max(len(self.keys) - 1, 0))
+        found = np.zeros(len(distinct), dtype=bool)
+        if len(self.keys):
+            found = self.keys[at] == distinct
+            matched = np.flatnonzero(found)  # only these need their genes compared
+            found[matched] = (self.genes[self.slots[at[matched]]] == population[first[matched]]).all(axis=(1, 2))
+        fitness = np.empty(len(distinct))
+        fitness[found] = self.fitness[at[found]]
+        self.last_used[at[found]] = generation
+
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            rows = first[missing]
+            fitness[missing] = optimizer.calculate_population_fitness(population[rows])
+            self.evict(len(missing))
+            stored = missing[:len(self.free_slots)]  # a generation with more new schedules than max_entries keeps the first
+            kept = len(self.free_slots) - len(stored)
+            slots, self.free_slots = self.free_slots[kept:], self.free_slots[:kept]
+            self.genes[slots] = population[first[stored]]
+            where = np.searchsorted(self.keys, distinct[stored])  # distinct is sorted, so this keeps the keys sorted
+            self.keys = np.insert(self.keys, where, distinct[stored])
+            self.slots = np.insert(self.slots, where, slots)
+            self.fitness = np.insert(self.fitness, where, fitness[stored])
+            self.last_used = np.insert(self.last_used, where, generation)
+
+        self.history.append(CacheGenerationStats(generation, len(population), len(population) - len(missing), len(self)))
+        return fitness[inverse]
+
+    def evict(self, room: int):  # drops the entries used longest ago until there is room for that many more
+        extra = len(self) + min(room, self.max_entries) - self.max_entries
+        if extra > 0:
+            oldest = np.argsort(self.last_used, kind="stable")[:extra]
+            self.free_slots = np.concatenate([self.free_slots, self.slots[oldest]])
+            self.keys, self.slots, self.fitness, self.last_used = (np.delete(values, oldest) for values in
+                                                                   (self.keys, self.slots, self.fitness, self.last_used))
+
+    def report(self) -> str:  # one line per generation
+        return "\n".join(f"Generation {stats.generation:>4}: {stats.hits:>4}/{stats.lookups} cached "
+                         f"({stats.hit_rate:6.1%}), {stats.entries} entries" for stats in self.history)
+
+# (size, activities) mask of the activities whose genes differ between two stacks of schedules
+def differing_activities(schedules1: np.ndarray, schedules2: np.ndarray) -> np.ndarray:
+    differs = schedules1 != schedules2
+    return differs[:, :, ROOM] | differs[:, :, TIME] | differs[:, :, FACILITATOR]  # much faster than .any(axis=2)
+
+# Runs one island's share of optimize_islands (on a worker process) and sends back its optimizer, for the random stream,
+# and its state
+def _evolve_island(job):
+    optimizer, state, generations, incremental = job
+    optimizer.evolve(state, generations, incremental)
+    return optimizer, state
+
 def main():
-    optimizer = ScheduleOptimizer()
-    best_schedule, best_fitness = optimizer.optimize(
-        population_size=500,
-        generations=100_000,
-        mutation_rate=0.1
-    )
+    parser = argparse.ArgumentParser(description="Genetic algorithm for the SLA activity schedule")
+    parser.add_argument("--seed", type=int, default=None, help="random seed, for a repeatable run")
+    parser.add_argument("--islands", type=int, default=1, help="populations evolving side by side (1 = a single population)")
+    parser.add_argument("--workers", type=int, default=None, help="processes for the islands (default: one per CPU)")
+    parser.add_argument("--topology", choices=["ring", "full"], default="ring", help="where each island's migrants go")
+    parser.add_argument("--migration-interval", type=int, default=10, help="generations between migrations")
+    parser.add_argument("--cache", type=int, default=0, metavar="ENTRIES",
+                        help="remember the fitness of up to this many schedules and report the hit rate per generation "
+                             "(slower unless most schedules repeat)")
+    args = parser.parse_args()
+
+    optimizer = ScheduleOptimizer(seed=args.seed)
+    if args.islands > 1:
+        caches = [FitnessCache(args.cache) for _ in range(args.islands)] if args.cache > 0 else None
+        best_schedule, best_fitness = optimizer.optimize_islands(
+            islands=args.islands,
+            population_size=500,
+            generations=100_000,
+            mutation_rate=0.1,
+            migration_interval=args.migration_interval,
+            topology=args.topology,
+            workers=args.workers,
+            caches=caches
+        )
+        for island, cache in enumerate(caches or []):
+            print(f"\nIsland {island + 1} fitness cache hit rate per generation:")
+            print(cache.report())
+    else:
+        state = EvolutionState(optimizer.create_random_population(500), mutation_rate=0.1,
+                               cache=FitnessCache(args.cache) if args.cache > 0 else None)
+        optimizer.evolve(state, generations=100_000)
+        best_schedule, best_fitness = state.best_schedule, state.best_fitness
+        if state.cache is not None:
+            print("\nFitness cache hit rate per generation:")
+            print(state.cache.report())
     
     print(f"\nBest Fitness Score: {best_fitness:.2f}")
     print(optimizer.print_schedule(best_schedule))